@@ -1,55 +1,230 @@
 from django.contrib import admin
-from .models import Category, Product, Customer, Order, OrderItem
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+from .models import (
+    Category, Product, Customer, Order, OrderItem, PriceHistory, ArchivedOrder, ArchivedOrderItem,
+    Location, LocationStock, ProductForecast, OutboxEvent, AuditLogEntry,
+)
+from .paginator import EstimatedCountPaginator
+from .counters import EMPTY_CONTRIBUTION, form_update_fields, order_contribution, apply_contribution_change
+from .pricing import record_price_change
+from .stock import record_stock_edit, sync_product_totals
+from .outbox import publish
+from .events import order_event_payload
+
+
+class CustomerSearchFilter(admin.SimpleListFilter):
+    """
+    Filters orders by a typed customer name prefix instead of rendering
+    one link per customer, which doesn't scale past a few hundred customers.
+    """
+    title = 'customer'
+    parameter_name = 'customer_name'
+    template = 'admin/input_filter.html'
+
+    def lookups(self, request, model_admin):
+        # A single dummy lookup so the admin renders the filter at all
+        return (('', ''),)
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        # Carry the other active filters along as hidden inputs in the form
+        all_choice['query_parts'] = [
+            (name, value)
+            for name, values in changelist.get_filters_params().items()
+            if name != self.parameter_name
+            for value in values
+        ]
+        yield all_choice
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(customer__name__istartswith=self.value())
+        return queryset
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ('name', 'description')
     search_fields = ('name',)
 
+@admin.register(Location)
+class LocationAdmin(admin.ModelAdmin):
+    list_display = ('name', 'priority', 'is_active')
+    list_editable = ('priority', 'is_active')
+
+class LocationStockInline(admin.TabularInline):
+    model = LocationStock
+    extra = 0
+
 @admin.register(Product)
 class ProductAdmin(admin.ModelAdmin):
-    list_display = ('name', 'category', 'price', 'stock_quantity', 'is_in_stock', 'updated_at')
+    list_display = ('name', 'category', 'price', 'stock_quantity', 'is_in_stock', 'units_sold', 'revenue', 'updated_at')
     list_filter = ('category', 'created_at')
     search_fields = ('name', 'description', 'category__name')
+    ordering = ('name',) # Stable ordering for pagination and autocomplete
     list_editable = ('price', 'stock_quantity') # Allow quick edits in the list view
+    list_select_related = ('category',) # __str__ and list_display both use the category
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False # Avoid a second COUNT(*) when searching/filtering
+
+    def get_inlines(self, request, obj):
+        # Per-location stock is edited on existing products; new ones start in the default location
+        return [LocationStockInline] if obj else []
+
+    def get_readonly_fields(self, request, obj=None):
+        # On the change form the total follows the per-location rows
+        return ('stock_quantity',) if obj else ()
+
+    def save_model(self, request, obj, form, change):
+        """Record price edits (including list_editable ones) in the price history."""
+        if change:
+            obj.save(update_fields=form_update_fields(form)) # Leave units_sold/revenue to their F() updates
+        else:
+            super().save_model(request, obj, form, change)
+        if change and 'price' in form.changed_data:
+            record_price_change(obj, form.initial.get('price'), user=request.user)
+        if 'stock_quantity' in form.changed_data or not change:
+            # New product or list_editable stock edit: apply to the default location
+            record_stock_edit(obj, form.initial.get('stock_quantity') if change else 0)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if formsets: # Location rows may have changed
+            sync_product_totals([form.instance.pk])
+
+@admin.register(ProductForecast)
+class ProductForecastAdmin(admin.ModelAdmin):
+    """Reorder list: products with the largest suggested order first."""
+    list_display = ('product', 'suggested_order_quantity', 'reorder_point', 'avg_daily_7', 'avg_daily_28',
+                    'smoothed_daily', 'computed_at')
+    list_select_related = ('product__category',)
+    ordering = ('-suggested_order_quantity',)
+    search_fields = ('product__name',)
+
+    def has_add_permission(self, request):
+        return False # Written by the refresh_forecasts command
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(admin.ModelAdmin):
+    """Queue of side effects waiting for the process_outbox command."""
+    list_display = ('id', 'event_type', 'order_key', 'status', 'attempts', 'available_at', 'created_at', 'processed_at')
+    list_filter = ('status', 'event_type')
+    search_fields = ('=order_key',)
+    readonly_fields = [field.name for field in OutboxEvent._meta.fields]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ['retry_events']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Retry selected events now")
+    def retry_events(self, request, queryset):
+        updated = queryset.exclude(status='DONE').update(status='PENDING', attempts=0, available_at=timezone.now())
+        self.message_user(request, f"{updated} events queued for retry.")
+
+@admin.register(AuditLogEntry)
+class AuditLogEntryAdmin(admin.ModelAdmin):
+    """Read-only field-level change log written by inventory.audit."""
+    list_display = ('timestamp', 'user', 'action', 'model', 'object_id', 'order_key', 'changes')
+    list_filter = ('action', 'model')
+    date_hierarchy = 'timestamp'
+    search_fields = ('=object_id', '=order_key', '=user__username')
+    list_select_related = ('user',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(PriceHistory)
+class PriceHistoryAdmin(admin.ModelAdmin):
+    list_display = ('product', 'old_price', 'new_price', 'changed_at', 'changed_by')
+    list_select_related = ('product__category', 'changed_by')
+    date_hierarchy = 'changed_at'
+    search_fields = ('product__name',)
+    autocomplete_fields = ['product']
 
 @admin.register(Customer)
 class CustomerAdmin(admin.ModelAdmin):
-    list_display = ('name', 'phone_number', 'email', 'address', 'created_at')
+    list_display = ('name', 'phone_number', 'email', 'address', 'balance_due', 'lifetime_spend', 'created_at')
     search_fields = ('name', 'phone_number', 'email', 'address')
+    ordering = ('name',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        if change:
+            obj.save(update_fields=form_update_fields(form)) # Leave balance_due/lifetime_spend to their F() updates
+        else:
+            super().save_model(request, obj, form, change)
 
 class OrderItemInline(admin.TabularInline): # Display order items directly within the order admin page
     model = OrderItem
     extra = 1 # Number of empty forms to display
     readonly_fields = ('price_at_order',) # Don't allow editing historical price here
-    # Add autocomplete for product selection if you have many products
-    # autocomplete_fields = ['product']
+    autocomplete_fields = ['product'] # Uses ProductAdmin.search_fields
 
 @admin.register(Order)
 class OrderAdmin(admin.ModelAdmin):
     list_display = ('id', 'customer', 'order_date', 'status', 'total_amount', 'amount_paid', 'get_amount_due', 'created_by')
-    list_filter = ('status', 'order_date', 'customer')
-    search_fields = ('id', 'customer__name', 'customer__phone_number', 'items__product__name')
+    list_filter = ('status', 'order_date', CustomerSearchFilter)
+    # Product names are matched in get_search_results() with a subquery instead of
+    # joining items__product__name, which multiplies rows per order item
+    search_fields = ('=id', 'customer__name', 'customer__phone_number')
     readonly_fields = ('order_date', 'total_amount') # Total amount calculated automatically
+    autocomplete_fields = ['customer'] # Uses CustomerAdmin.search_fields
     inlines = [OrderItemInline] # Add the inline items
     list_editable = ('status', 'amount_paid')
+    list_select_related = ('customer', 'created_by')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
-    # If using autocomplete_fields in OrderItemInline
-    # search_fields = ProductAdmin.search_fields # Make products searchable for autocomplete
+    def get_search_results(self, request, queryset, search_term):
+        filtered, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            has_product = Exists(OrderItem.objects.filter(order=OuterRef('pk'), product__name__icontains=search_term))
+            filtered |= queryset.filter(has_product)
+        return filtered, may_have_duplicates
 
     def save_model(self, request, obj, form, change):
         """Assign current user when creating an order in admin."""
         if not obj.pk: # Only set created_by on creation
             obj.created_by = request.user
+        # Remember the stored order's counter contribution; save_related() applies the change
+        stored = Order.objects.filter(pk=obj.pk).first() if obj.pk else None
+        obj._initial_contribution = order_contribution(stored)
         super().save_model(request, obj, form, change)
 
     def save_related(self, request, form, formsets, change):
         """Recalculate total and update status after saving related items (OrderItems)."""
-        super().save_related(request, form, formsets, change)
         order = form.instance
+        initial_items = list(order.items.all()) if change else [] # Lines deleted in the inline are gone after super()
+        super().save_related(request, form, formsets, change)
         order.calculate_total()
         order.update_status()
         order.save() # Save the updated total and status
+        apply_contribution_change(order._initial_contribution, order_contribution(order))
+        publish('order.updated' if change else 'order.created', order, order_event_payload(order, removed=initial_items))
+
+    def delete_model(self, request, obj):
+        apply_contribution_change(order_contribution(obj), EMPTY_CONTRIBUTION)
+        publish('order.deleted', obj, order_event_payload(obj))
+        super().delete_model(request, obj)
+
+    @transaction.atomic
+    def delete_queryset(self, request, queryset):
+        for order in queryset:
+            apply_contribution_change(order_contribution(order), EMPTY_CONTRIBUTION)
+            publish('order.deleted', order, order_event_payload(order))
+        super().delete_queryset(request, queryset)
 
 
 # Note: OrderItem doesn't usually need its own admin registration
@@ -58,4 +233,30 @@ class OrderAdmin(admin.ModelAdmin):
 # class OrderItemAdmin(admin.ModelAdmin):
 #     list_display = ('order', 'product', 'quantity', 'price_at_order', 'get_item_total')
 #     list_filter = ('order__customer', 'product__category')
-#     search_fields = ('order__id', 'product__name')
\ No newline at end of file
+#     search_fields = ('order__id', 'product__name')
+
+class ArchivedOrderItemInline(admin.TabularInline):
+    model = ArchivedOrderItem
+    extra = 0
+    can_delete = False
+    readonly_fields = ('product', 'quantity', 'price_at_order')
+
+    def has_add_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedOrder)
+class ArchivedOrderAdmin(admin.ModelAdmin):
+    """Read-only view of orders moved out by the archive_orders command."""
+    list_display = ('id', 'customer', 'order_date', 'status', 'total_amount', 'amount_paid', 'archived_at')
+    list_filter = ('status', 'order_date')
+    search_fields = ('=id', 'customer__name')
+    list_select_related = ('customer',)
+    inlines = [ArchivedOrderItemInline]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
@@ -0,0 +1,11 @@
+from django.apps import AppConfig
+
+
+class InventoryConfig(AppConfig):
+    default_auto_field = 'django.db.models.BigAutoField'
+    name = 'inventory'
+
+    def ready(self):
+        from . import audit, auth
+        auth.connect_signals()
+        audit.connect_signals()
@@ -0,0 +1,73 @@
+"""
+Moves closed orders out of the hot Order/OrderItem tables into the archive
+tables, one bounded batch per transaction so writers are never blocked for
+long. Archived orders keep their primary keys and stay readable through
+OrderDetailView and CustomerDetailView.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from . import audit
+from .models import Order, OrderItem, ArchivedOrder, ArchivedOrderItem, OrderArchiveSummary
+
+ARCHIVABLE_STATUSES = ['DELIVERED', 'PAID', 'CANCELLED']
+
+
+def archive_batch(cutoff, batch_size=500):
+    """Archives up to `batch_size` closed orders placed before `cutoff`. Returns how many were moved."""
+    with transaction.atomic():
+        orders = Order.objects.filter(status__in=ARCHIVABLE_STATUSES, order_date__lt=cutoff).order_by('pk')
+        if connection.features.has_select_for_update_skip_locked:
+            # Orders being edited right now are simply picked up by a later run
+            orders = orders.select_for_update(skip_locked=True)
+        orders = list(orders[:batch_size])
+        if not orders:
+            return 0
+        ids = [order.pk for order in orders]
+
+        ArchivedOrder.objects.bulk_create([
+            ArchivedOrder(
+                id=order.pk, customer_id=order.customer_id, order_date=order.order_date,
+                total_amount=order.total_amount, amount_paid=order.amount_paid, status=order.status,
+                created_by_id=order.created_by_id, notes=order.notes,
+            )
+            for order in orders
+        ])
+        ArchivedOrderItem.objects.bulk_create([
+            ArchivedOrderItem(order_id=order_id, product_id=product_id, quantity=quantity, price_at_order=price)
+            for order_id, product_id, quantity, price in OrderItem.objects.filter(order_id__in=ids)
+            .values_list('order_id', 'product_id', 'quantity', 'price_at_order')
+        ])
+        _add_to_summary(orders)
+
+        with audit.suppressed(): # Moved, not deleted: keep them out of the audit log
+            OrderItem.objects.filter(order_id__in=ids).delete()
+            Order.objects.filter(pk__in=ids).delete()
+        return len(ids)
+
+
+def _add_to_summary(orders):
+    totals = defaultdict(lambda: [0, Decimal('0.00'), Decimal('0.00')])
+    for order in orders:
+        month = timezone.localtime(order.order_date).date().replace(day=1)
+        row = totals[(month, order.customer_id, order.status)]
+        row[0] += 1
+        row[1] += order.total_amount
+        row[2] += order.amount_paid
+
+    for (month, customer_id, status), (count, total, paid) in totals.items():
+        summary = OrderArchiveSummary.objects.filter(month=month, customer_id=customer_id, status=status)
+        add = {'order_count': F('order_count') + count, 'total_amount': F('total_amount') + total,
+               'amount_paid': F('amount_paid') + paid}
+        if summary.update(**add):
+            continue
+        try:
+            with transaction.atomic(): # A savepoint, so a lost race doesn't abort the batch
+                OrderArchiveSummary.objects.create(month=month, customer_id=customer_id, status=status,
+                                                   order_count=count, total_amount=total, amount_paid=paid)
+        except IntegrityError: # Another archiver created the row in between
+            summary.update(**add)
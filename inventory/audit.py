@@ -0,0 +1,223 @@
+"""
+Field-level audit log for orders, order items, products and customers.
+
+Signal handlers compare each saved or deleted instance with the values it was
+loaded with (remembered in post_init, so no extra query) and produce an
+AuditLogEntry holding {field: [before, after]} for the fields that changed.
+
+Entries are handed over with transaction.on_commit, so changes that roll
+back (including savepoint rollbacks) are never logged. Inside a request,
+AuditMiddleware collects the committed entries, merges repeated saves of the
+same object, and writes them with one bulk_create when the response is ready.
+Outside requests (management commands, the shell) entries are written as
+each transaction commits, unless the code runs inside `with audit_context(user):`.
+
+Only editable fields are tracked: maintained counters (units_sold,
+balance_due, ...), the derived phone/email keys and timestamps are not.
+QuerySet.update() sends no signals, so code that changes tracked fields that
+way logs the change itself with log_update(); inventory.stock does this for
+every stock movement. Code that moves rows rather than changing them (the
+archive job) runs inside `with suppressed():`.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import lru_cache, partial
+
+from django.apps import apps
+from django.db import router, transaction
+from django.db.models.expressions import Combinable
+from django.db.models.signals import post_delete, post_init, post_save
+from django.utils import timezone
+
+AUDITED_MODELS = ['inventory.Order', 'inventory.OrderItem', 'inventory.Product', 'inventory.Customer', 'inventory.LocationStock']
+
+_MISSING = object()
+
+
+class _AuditContext:
+    __slots__ = ('request', 'user', 'entries')
+
+    def __init__(self, request=None, user=None):
+        self.request = request
+        self.user = user
+        self.entries = [] # Committed entries waiting for flush()
+
+
+_context = ContextVar('audit_context', default=None)
+_suppressed = ContextVar('audit_suppressed', default=False)
+
+
+@contextmanager
+def audit_context(user=None, request=None):
+    """Attributes changes in the block to `user` (or request.user) and writes their entries in one insert."""
+    context = _AuditContext(request, user)
+    token = _context.set(context)
+    try:
+        yield context
+    finally:
+        _context.reset(token)
+        flush(context)
+
+
+@contextmanager
+def suppressed():
+    """Logs nothing for saves and deletes in the block, e.g. rows moved to the archive tables."""
+    token = _suppressed.set(True)
+    try:
+        yield
+    finally:
+        _suppressed.reset(token)
+
+
+class AuditMiddleware:
+    """Collects the audit entries of a request and writes them once it is handled. Goes after AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with audit_context(request=request):
+            return self.get_response(request)
+
+
+@lru_cache(maxsize=None)
+def _tracked_fields(model):
+    return [field for field in model._meta.concrete_fields if field.editable and not field.primary_key]
+
+
+def _values(instance):
+    """The tracked fields' current values, skipping deferred fields and unsaved F() expressions."""
+    values = {}
+    for field in _tracked_fields(type(instance)):
+        value = instance.__dict__.get(field.attname, _MISSING)
+        if value is not _MISSING and not isinstance(value, Combinable):
+            values[field.name] = value
+    return values
+
+
+def _current_user_id(context):
+    if context is None:
+        return None
+    if context.request is not None:
+        user = getattr(context.request, 'user', None)
+        return user.pk if user is not None and user.is_authenticated else None
+    return context.user.pk if context.user is not None else None
+
+
+def _queue(model_label, object_id, order_key, action, changes, using):
+    from .models import AuditLogEntry
+
+    context = _context.get()
+    entry = AuditLogEntry(
+        model=model_label, object_id=object_id, order_key=order_key, action=action,
+        changes=changes, user_id=_current_user_id(context), timestamp=timezone.now(),
+    )
+    if context is None:
+        deliver = partial(AuditLogEntry.objects.bulk_create, [entry])
+    else:
+        deliver = partial(context.entries.append, entry)
+    # Dropped by Django if the transaction or savepoint rolls back; runs at once in autocommit
+    transaction.on_commit(deliver, using=using)
+
+
+def _queue_instance(instance, action, changes):
+    from .models import Order, OrderItem
+
+    if isinstance(instance, Order):
+        order_key = instance.pk
+    elif isinstance(instance, OrderItem):
+        order_key = instance.order_id
+    else:
+        order_key = None
+    _queue(instance._meta.label_lower, instance.pk, order_key, action, changes, instance._state.db)
+
+
+def log_update(model, object_id, changes):
+    """
+    Logs {field: [before, after]} for a row changed with QuerySet.update(),
+    which sends no signals. Goes through the same on_commit hand-off and
+    per-request batching as changes picked up from signals.
+    """
+    if changes and not _suppressed.get():
+        _queue(model._meta.label_lower, object_id, None, 'UPDATE', changes, router.db_for_write(model))
+
+
+def _remember_values(sender, instance, **kwargs):
+    instance._audit_values = _values(instance)
+
+
+def _log_save(sender, instance, created, update_fields=None, raw=False, **kwargs):
+    if raw or _suppressed.get(): # Fixture loading, or moving rows
+        return
+    before = getattr(instance, '_audit_values', {})
+    after = _values(instance)
+    if created:
+        changes = {name: [None, value] for name, value in after.items() if value not in (None, '')}
+        _queue_instance(instance, 'CREATE', changes)
+    else:
+        names = update_fields if update_fields is not None else after.keys()
+        changes = {
+            name: [before[name], after[name]]
+            for name in names
+            if name in before and name in after and before[name] != after[name]
+        }
+        if changes:
+            _queue_instance(instance, 'UPDATE', changes)
+    instance._audit_values = {**before, **after}
+
+
+def _log_delete(sender, instance, **kwargs):
+    if _suppressed.get():
+        return
+    before = {**getattr(instance, '_audit_values', {}), **_values(instance)}
+    _queue_instance(instance, 'DELETE', {name: [value, None] for name, value in before.items() if value not in (None, '')})
+
+
+def _coalesce(entries):
+    """Merges entries for the same object and user, e.g. an order saved twice by one view."""
+    merged = []
+    latest = {} # (model, object_id, user_id) -> that object's last entry in `merged`
+    for entry in entries:
+        key = (entry.model, entry.object_id, entry.user_id)
+        previous = latest.get(key)
+        if previous is None or previous.action == 'DELETE' or entry.action == 'CREATE':
+            merged.append(entry)
+            latest[key] = entry
+            continue
+        if entry.action == 'DELETE':
+            if previous.action == 'CREATE': # Created and deleted again: nothing to record
+                merged.remove(previous)
+                del latest[key]
+            else:
+                merged.append(entry)
+                latest[key] = entry
+            continue
+        for name, (before, after) in entry.changes.items():
+            first = None if previous.action == 'CREATE' else previous.changes.get(name, [before])[0]
+            if first == after and previous.action == 'UPDATE':
+                previous.changes.pop(name, None) # Changed and changed back
+            else:
+                previous.changes[name] = [first, after]
+        previous.timestamp = entry.timestamp
+        if not previous.changes:
+            merged.remove(previous)
+            del latest[key]
+    return merged
+
+
+def flush(context):
+    from .models import AuditLogEntry
+
+    if context.entries:
+        AuditLogEntry.objects.bulk_create(_coalesce(context.entries))
+        context.entries = []
+
+
+def connect_signals():
+    """Called from InventoryConfig.ready()."""
+    for label in AUDITED_MODELS:
+        model = apps.get_model(label)
+        uid = f'inventory.audit.{model._meta.model_name}'
+        post_init.connect(_remember_values, sender=model, dispatch_uid=f'{uid}.init')
+        post_save.connect(_log_save, sender=model, dispatch_uid=f'{uid}.save')
+        post_delete.connect(_log_delete, sender=model, dispatch_uid=f'{uid}.delete')
@@ -0,0 +1,66 @@
+"""
+Authentication backend that caches users.
+
+ModelBackend.get_user() runs a SELECT on auth_user for every authenticated
+request. CachedModelBackend keeps the user in the default cache for
+AUTH_USER_CACHE_SECONDS instead. The entry is dropped whenever the user, or
+their groups or direct permissions, are saved through the ORM. Changes made
+with QuerySet.update() or raw SQL bypass the signals and show up when the
+entry expires; call invalidate_user() after such changes.
+
+The session auth hash is still checked against the cached user, so a
+password change logs out other sessions as before (saving the user
+invalidates the entry).
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db.models.signals import m2m_changed, post_delete, post_save
+
+
+def _cache_key(user_id):
+    return f'auth:user:{user_id}'
+
+
+def invalidate_user(user_id):
+    cache.delete(_cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = _cache_key(user_id)
+        user = cache.get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is None:
+                return None
+            cache.set(key, user, getattr(settings, 'AUTH_USER_CACHE_SECONDS', 300))
+        # Re-checked on every request, like ModelBackend (is_active may be changed by update())
+        return user if self.user_can_authenticate(user) else None
+
+
+def _user_changed(sender, instance, **kwargs):
+    invalidate_user(instance.pk)
+
+
+def _user_relations_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action.startswith('post_'):
+            invalidate_user(instance.pk)
+    elif action == 'pre_clear': # group.user_set.clear(): find the users before the rows go
+        for user_id in instance.user_set.values_list('pk', flat=True):
+            invalidate_user(user_id)
+    elif action in ('post_add', 'post_remove'): # Changed from the group/permission side
+        for user_id in pk_set:
+            invalidate_user(user_id)
+
+
+def connect_signals():
+    """Called from InventoryConfig.ready() so every process invalidates, not only web workers."""
+    User = get_user_model()
+    post_save.connect(_user_changed, sender=User, dispatch_uid='inventory.auth.user_saved')
+    post_delete.connect(_user_changed, sender=User, dispatch_uid='inventory.auth.user_deleted')
+    for relation in (User.groups, User.user_permissions):
+        m2m_changed.connect(_user_relations_changed, sender=relation.through,
+                            dispatch_uid=f'inventory.auth.{relation.field.name}_changed')
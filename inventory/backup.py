@@ -0,0 +1,333 @@
+"""
+Online backups of the store database, and restores.
+
+Two formats, both gzip-compressed and SHA-256 checksummed, each described by
+a JSON manifest in BACKUP_DIR:
+
+* sqlite-chunks (SQLite only): a snapshot taken with SQLite's online backup
+  API, so writers keep going and the copy is never torn. The snapshot is cut
+  into fixed-size chunks stored by content hash under BACKUP_DIR/chunks;
+  chunks already stored by an earlier backup are reused, which makes every
+  backup after the first incremental.
+* logical (any database): every table streamed in primary key order as JSON
+  lines, inside one REPEATABLE READ (PostgreSQL) or read transaction, so the
+  dump is a consistent snapshot without blocking writers. Always full.
+
+prune() only deletes chunks that no kept manifest lists and that have not
+been written or reused for PRUNE_GRACE seconds: a backup that is still
+running has no manifest yet, but it touches every chunk it uses.
+
+Restores stream the data back: chunks are verified and written one at a time,
+logical rows are inserted with bulk_create in batches.
+"""
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from pathlib import Path
+
+from django.apps import apps
+from django.conf import settings
+from django.core import serializers
+from django.core.management.color import no_style
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.utils import timezone
+
+CHUNK_SIZE = 256 * 1024 # A multiple of every SQLite page size; smaller chunks make incremental backups smaller
+PRUNE_GRACE = 24 * 3600 # Seconds; longer than any backup takes
+
+
+class Throughput:
+    """Counts rows and bytes and reports the rate since creation."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.rows = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    @property
+    def seconds(self):
+        return time.perf_counter() - self.started
+
+    def __str__(self):
+        seconds = max(self.seconds, 1e-9)
+        parts = [f"{seconds:.2f}s"]
+        if self.rows:
+            parts.append(f"{self.rows} rows ({self.rows / seconds:,.0f} rows/s)")
+        parts.append(f"{self.bytes_in / 1e6:.1f} MB read ({self.bytes_in / 1e6 / seconds:.1f} MB/s)")
+        parts.append(f"{self.bytes_out / 1e6:.1f} MB written")
+        return ", ".join(parts)
+
+
+def backup_dir():
+    path = Path(getattr(settings, 'BACKUP_DIR', Path(settings.BASE_DIR) / 'backups'))
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _chunk_path(digest):
+    return backup_dir() / 'chunks' / digest[:2] / f'{digest}.gz'
+
+
+def _write_manifest(manifest):
+    path = backup_dir() / f"{manifest['name']}.json"
+    path.write_text(json.dumps(manifest, indent=2))
+    return path
+
+
+def load_manifest(path):
+    path = Path(path)
+    if not path.exists(): # Allow a name inside BACKUP_DIR, with or without .json
+        path = backup_dir() / (path.name if path.suffix == '.json' else f'{path.name}.json')
+    return json.loads(path.read_text())
+
+
+def _backup_name(alias, kind):
+    return f"{alias}-{timezone.now():%Y%m%d-%H%M%S}-{kind}"
+
+
+# --- SQLite snapshots ---
+
+def _sqlite_path(alias):
+    connection = connections[alias]
+    if connection.vendor != 'sqlite':
+        raise ValueError(f"Database '{alias}' is not SQLite; use the logical format.")
+    return str(connection.settings_dict['NAME'])
+
+
+def journal_mode(alias):
+    with connections[alias].cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        return cursor.fetchone()[0].lower()
+
+
+def snapshot_sqlite(alias, target, pages=-1, pause=0.0):
+    """
+    Copies the live database to the file `target` with the online backup API.
+    In WAL mode one step (pages=-1) reads a consistent snapshot while writers
+    carry on. In rollback-journal mode a reader blocks commits, so copy a few
+    pages per step with a pause between steps to let writers in; SQLite
+    restarts the copy if another connection writes in between.
+    """
+    source = sqlite3.connect(_sqlite_path(alias))
+    destination = sqlite3.connect(target)
+    try:
+        with destination:
+            source.backup(destination, pages=pages, sleep=pause)
+    finally:
+        destination.close()
+        source.close()
+
+
+def backup_sqlite(alias='default', pages=-1, pause=0.0, chunk_size=CHUNK_SIZE):
+    """Takes an incremental, chunked snapshot. Returns (manifest, Throughput)."""
+    stats = Throughput()
+    name = _backup_name(alias, 'sqlite')
+    fd, snapshot = tempfile.mkstemp(dir=backup_dir(), prefix='.snapshot-')
+    os.close(fd)
+    try:
+        snapshot_sqlite(alias, snapshot, pages, pause)
+        whole = hashlib.sha256()
+        chunks = []
+        reused = 0
+        with open(snapshot, 'rb') as source:
+            while data := source.read(chunk_size):
+                stats.bytes_in += len(data)
+                whole.update(data)
+                digest = hashlib.sha256(data).hexdigest()
+                chunks.append(digest)
+                path = _chunk_path(digest)
+                try:
+                    os.utime(path) # Unchanged since an earlier backup; the new mtime keeps prune() off it
+                    reused += 1
+                    continue
+                except FileNotFoundError:
+                    pass
+                path.parent.mkdir(parents=True, exist_ok=True)
+                partial = path.with_suffix('.part')
+                with gzip.open(partial, 'wb', compresslevel=6) as out:
+                    out.write(data)
+                partial.replace(path) # Never leave a truncated chunk under its final name
+                stats.bytes_out += path.stat().st_size
+    finally:
+        os.remove(snapshot)
+
+    manifest = {
+        'name': name, 'format': 'sqlite-chunks', 'database': alias, 'created': timezone.now().isoformat(),
+        'size': stats.bytes_in, 'sha256': whole.hexdigest(), 'chunk_size': chunk_size,
+        'chunks': chunks, 'reused_chunks': reused,
+    }
+    _write_manifest(manifest)
+    return manifest, stats
+
+
+def restore_sqlite(manifest, alias='default', pages=1024):
+    """
+    Rebuilds the snapshot from its chunks (checking every hash), then copies
+    it over the live database with the backup API. Returns a Throughput.
+    """
+    target = _sqlite_path(alias)
+    stats = Throughput()
+    whole = hashlib.sha256()
+    fd, snapshot = tempfile.mkstemp(dir=backup_dir(), prefix='.restore-')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            for digest in manifest['chunks']:
+                path = _chunk_path(digest)
+                stats.bytes_in += path.stat().st_size
+                with gzip.open(path, 'rb') as chunk:
+                    data = chunk.read()
+                if hashlib.sha256(data).hexdigest() != digest:
+                    raise ValueError(f"Chunk {digest} is corrupt.")
+                whole.update(data)
+                out.write(data)
+                stats.bytes_out += len(data)
+        if whole.hexdigest() != manifest['sha256']:
+            raise ValueError("Restored database does not match the backup checksum.")
+
+        connections[alias].close() # Django's connection would otherwise hold stale pages
+        source = sqlite3.connect(snapshot)
+        destination = sqlite3.connect(target)
+        try:
+            with destination:
+                source.backup(destination, pages=pages)
+        finally:
+            destination.close()
+            source.close()
+    finally:
+        os.remove(snapshot)
+    return stats
+
+
+# --- Logical dumps ---
+
+def _dump_models():
+    """Every concrete model, parents before children, then the automatic many-to-many tables."""
+    models = serializers.sort_dependencies([(app_config, None) for app_config in apps.get_app_configs()], allow_cycles=True)
+    through = [model for model in apps.get_models(include_auto_created=True) if model._meta.auto_created]
+    return [model for model in models + through if model._meta.managed and not model._meta.proxy]
+
+
+def dump_logical(alias='default', batch_size=2000):
+    """Streams every table into one gzipped JSON-lines file. Returns (manifest, Throughput)."""
+    stats = Throughput()
+    name = _backup_name(alias, 'logical')
+    path = backup_dir() / f'{name}.jsonl.gz'
+    partial = path.with_suffix('.part')
+    counts = {}
+    connection = connections[alias]
+    with transaction.atomic(using=alias), gzip.open(partial, 'wt', compresslevel=6) as out:
+        if connection.vendor == 'postgresql':
+            # One snapshot for the whole dump; readers never block writers in PostgreSQL
+            with connection.cursor() as cursor:
+                cursor.execute('SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY')
+        for model in _dump_models():
+            label = model._meta.label_lower
+            counts[label] = 0
+            queryset = model._base_manager.using(alias).order_by('pk')
+            last_pk = None
+            while True: # Keyset pagination keeps every batch an index range scan
+                batch = list((queryset.filter(pk__gt=last_pk) if last_pk is not None else queryset)[:batch_size])
+                if not batch:
+                    break
+                for row in serializers.serialize('python', batch):
+                    line = json.dumps(row, cls=DjangoJSONEncoder)
+                    out.write(line + '\n')
+                    stats.bytes_in += len(line) + 1
+                counts[label] += len(batch)
+                stats.rows += len(batch)
+                last_pk = batch[-1].pk
+    partial.replace(path)
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as dump:
+        while data := dump.read(CHUNK_SIZE):
+            digest.update(data)
+    stats.bytes_out = path.stat().st_size
+    manifest = {
+        'name': name, 'format': 'logical', 'database': alias, 'vendor': connection.vendor,
+        'created': timezone.now().isoformat(), 'file': path.name, 'sha256': digest.hexdigest(), 'rows': counts,
+    }
+    _write_manifest(manifest)
+    return manifest, stats
+
+
+def restore_logical(manifest, alias='default', batch_size=2000):
+    """
+    Replaces the contents of every dumped table with the dump, in one
+    transaction. The target must already be migrated to the same schema.
+    Returns a Throughput.
+    """
+    path = backup_dir() / manifest['file']
+    digest = hashlib.sha256()
+    with open(path, 'rb') as dump:
+        while data := dump.read(CHUNK_SIZE):
+            digest.update(data)
+    if digest.hexdigest() != manifest['sha256']:
+        raise ValueError(f"{path.name} does not match the backup checksum.")
+
+    stats = Throughput()
+    stats.bytes_in = path.stat().st_size
+    connection = connections[alias]
+    models = {model._meta.label_lower: model for model in _dump_models()}
+    restored = [models[label] for label in manifest['rows'] if label in models]
+
+    def flush(model, rows):
+        # Build the instances without save(), signals or many-to-many handling
+        objects = [item.object for item in serializers.deserialize('python', rows, using=alias, ignorenonexistent=True)]
+        model._base_manager.using(alias).bulk_create(objects, batch_size=batch_size)
+        stats.rows += len(objects)
+
+    with transaction.atomic(using=alias), connection.constraint_checks_disabled():
+        tables = [model._meta.db_table for model in restored]
+        connection.ops.execute_sql_flush(connection.ops.sql_flush(no_style(), tables, allow_cascade=True))
+        model, batch = None, []
+        with gzip.open(path, 'rt') as dump:
+            for line in dump:
+                row = json.loads(line)
+                if model is None or row['model'] != model._meta.label_lower:
+                    if batch:
+                        flush(model, batch)
+                    model, batch = models[row['model']], []
+                batch.append(row)
+                stats.bytes_out += len(line)
+                if len(batch) >= batch_size:
+                    flush(model, batch)
+                    batch = []
+        if batch:
+            flush(model, batch)
+        # New rows must not collide with restored primary keys (PostgreSQL sequences)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), restored):
+                cursor.execute(sql)
+        connection.check_constraints(table_names=tables)
+    return stats
+
+
+def prune(keep, grace=PRUNE_GRACE):
+    """
+    Deletes all but the newest `keep` backups and the chunks no remaining
+    backup uses, except chunks touched in the last `grace` seconds, which may
+    belong to a backup still being written.
+    """
+    cutoff = time.time() - grace
+    manifests = sorted(backup_dir().glob('*.json'), key=lambda path: path.stat().st_mtime, reverse=True)
+    for path in manifests[keep:]:
+        manifest = json.loads(path.read_text())
+        if manifest['format'] == 'logical':
+            (backup_dir() / manifest['file']).unlink(missing_ok=True)
+        path.unlink()
+    used = set()
+    for path in manifests[:keep]:
+        used.update(json.loads(path.read_text()).get('chunks', []))
+    removed = 0
+    for chunk in (backup_dir() / 'chunks').glob('*/*.gz'):
+        if chunk.name[:-3] not in used and chunk.stat().st_mtime < cutoff:
+            chunk.unlink()
+            removed += 1
+    return len(manifests[keep:]), removed
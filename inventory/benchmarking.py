@@ -0,0 +1,25 @@
+"""
+Helpers shared by the bench_* management commands.
+"""
+from contextlib import contextmanager
+
+from django.db import transaction
+
+
+class QueryCounter:
+    """Database execute wrapper that counts queries, independent of DEBUG."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+@contextmanager
+def rolled_back(using=None):
+    """Runs the block in a transaction that is always rolled back, so benchmark data is never kept."""
+    with transaction.atomic(using=using):
+        yield
+        transaction.set_rollback(True, using=using)
@@ -0,0 +1,108 @@
+"""
+Maintains the denormalized sales counters on Product (units_sold, revenue)
+and Customer (balance_due, lifetime_spend).
+
+Views take a snapshot of an order's contribution before and after changing
+it, then apply the difference with F() expressions inside the same
+transaction. Cancelled orders contribute nothing.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import DecimalField, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Product, Customer, Order, OrderItem, ArchivedOrderItem, OrderArchiveSummary
+
+ZERO = Decimal('0.00')
+
+EMPTY_CONTRIBUTION = {'customer_id': None, 'total': ZERO, 'due': ZERO, 'items': {}}
+
+
+def form_update_fields(form):
+    """
+    The fields to write when saving an edit made through `form`: those the
+    form changed, plus auto_now timestamps. A full save() would also write the
+    counters (and stock) as read before the transaction, undoing any F()
+    updates committed by orders in between.
+    """
+    fields = form.instance._meta.concrete_fields
+    names = {field.name for field in fields}
+    return ([name for name in form.changed_data if name in names]
+            + [field.name for field in fields if getattr(field, 'auto_now', False)])
+
+
+def order_contribution(order):
+    """Returns what a saved order currently adds to the counters."""
+    if order is None or order.pk is None or order.status == 'CANCELLED':
+        return EMPTY_CONTRIBUTION
+    items = defaultdict(lambda: (0, ZERO))
+    for product_id, quantity, price in order.items.values_list('product_id', 'quantity', 'price_at_order'):
+        units, revenue = items[product_id]
+        items[product_id] = (units + quantity, revenue + quantity * price)
+    return {
+        'customer_id': order.customer_id,
+        'total': order.total_amount,
+        'due': order.get_amount_due(),
+        'items': dict(items),
+    }
+
+
+def apply_contribution_change(before, after):
+    """Applies the difference between two contributions with one UPDATE per touched row."""
+    product_deltas = defaultdict(lambda: [0, ZERO])
+    for sign, contribution in ((-1, before), (1, after)):
+        for product_id, (units, revenue) in contribution['items'].items():
+            product_deltas[product_id][0] += sign * units
+            product_deltas[product_id][1] += sign * revenue
+
+    for product_id, (units, revenue) in product_deltas.items():
+        if units or revenue:
+            Product.objects.filter(pk=product_id).update(
+                units_sold=F('units_sold') + units,
+                revenue=F('revenue') + revenue,
+            )
+
+    customer_deltas = defaultdict(lambda: [ZERO, ZERO])
+    for sign, contribution in ((-1, before), (1, after)):
+        if contribution['customer_id'] is not None:
+            customer_deltas[contribution['customer_id']][0] += sign * contribution['due']
+            customer_deltas[contribution['customer_id']][1] += sign * contribution['total']
+
+    for customer_id, (due, total) in customer_deltas.items():
+        if due or total:
+            Customer.objects.filter(pk=customer_id).update(
+                balance_due=F('balance_due') + due,
+                lifetime_spend=F('lifetime_spend') + total,
+            )
+
+
+def _sum_or_zero(queryset, expression, zero, output_field):
+    """Correlated subquery for SUM(expression) over `queryset`, 0 when there are no rows."""
+    return Coalesce(Subquery(queryset.annotate(s=Sum(expression, output_field=output_field)).values('s')),
+                    Value(zero), output_field=output_field)
+
+
+def rebuild_counters():
+    """
+    Recomputes every counter from the order tables, one UPDATE per model.
+    Archived orders are included so archiving never changes the counters.
+    """
+    money = DecimalField(max_digits=14, decimal_places=2)
+    units = IntegerField()
+    line_total = ExpressionWrapper(F('quantity') * F('price_at_order'), output_field=money)
+
+    items = OrderItem.objects.filter(product=OuterRef('pk')).exclude(order__status='CANCELLED').values('product')
+    archived_items = ArchivedOrderItem.objects.filter(product=OuterRef('pk')).exclude(order__status='CANCELLED').values('product')
+    Product.objects.update(
+        units_sold=_sum_or_zero(items, F('quantity'), 0, units) + _sum_or_zero(archived_items, F('quantity'), 0, units),
+        revenue=_sum_or_zero(items, line_total, ZERO, money) + _sum_or_zero(archived_items, line_total, ZERO, money),
+    )
+
+    orders = Order.objects.filter(customer=OuterRef('pk')).exclude(status='CANCELLED').values('customer')
+    summaries = OrderArchiveSummary.objects.filter(customer=OuterRef('pk')).exclude(status='CANCELLED').values('customer')
+    due = F('total_amount') - F('amount_paid')
+    Customer.objects.update(
+        balance_due=_sum_or_zero(orders, due, ZERO, money) + _sum_or_zero(summaries, due, ZERO, money),
+        lifetime_spend=_sum_or_zero(orders, F('total_amount'), ZERO, money) + _sum_or_zero(summaries, F('total_amount'), ZERO, money),
+    )
@@ -0,0 +1,179 @@
+"""
+Duplicate customer lookup and merging.
+
+Lookups and the dedup job only compare customers that share a normalized
+phone_key or email_key (both indexed, see inventory.normalize), so they
+never scan the whole table or compare all pairs.
+"""
+import re
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connections, transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Value, When
+
+from .models import Customer, Order, ArchivedOrder, OrderArchiveSummary
+from .normalize import PHONE_KEY_DIGITS, normalize_email, normalize_name, normalize_phone
+
+MIN_PHONE_PREFIX = 4
+MIN_EMAIL_PREFIX = 3
+
+
+def _key_prefix(field, prefix, using='default'):
+    """
+    Q for `field` starting with `prefix` that can use the field's index.
+    PostgreSQL indexes CharFields with varchar_pattern_ops as well, so LIKE
+    'x%' is indexed there; SQLite's LIKE is case-insensitive and can't use a
+    plain index, but a range does, since keys compare byte by byte.
+    """
+    if connections[using].vendor == 'sqlite':
+        upper = prefix[:-1] + chr(ord(prefix[-1]) + 1)
+        return Q(**{f'{field}__gte': prefix, f'{field}__lt': upper})
+    return Q(**{f'{field}__startswith': prefix})
+
+
+def _phone_candidates(phone):
+    """
+    What the start of the stored phone_key may look like, for a phone number
+    typed so far. A trunk 0 is dropped. After + or 00 comes a country code of
+    one to three digits, which isn't part of the key, so each length is tried.
+    """
+    typed = (phone or '').strip()
+    digits = re.sub(r'\D', '', typed)
+    if typed.startswith('+') or digits.startswith('00'):
+        digits = digits.lstrip('0')
+        return [digits] + [digits[length:] for length in (1, 2, 3)]
+    return [digits.lstrip('0')]
+
+
+def matching_customers(phone='', email='', limit=10, exact=False):
+    """
+    Customers whose phone or email match what has been typed so far: a
+    prefix match on the keys, or an exact one once the phone number is
+    complete. With `exact`, only customers with the same normalized phone
+    or email.
+    """
+    conditions = Q()
+    phone_key, email_key = normalize_phone(phone), normalize_email(email)
+    if exact:
+        if phone_key:
+            conditions |= Q(phone_key=phone_key)
+        if email_key:
+            conditions |= Q(email_key=email_key)
+    else:
+        for digits in _phone_candidates(phone):
+            if len(digits) >= PHONE_KEY_DIGITS:
+                conditions |= Q(phone_key=digits[-PHONE_KEY_DIGITS:])
+            elif len(digits) >= MIN_PHONE_PREFIX:
+                conditions |= _key_prefix('phone_key', digits)
+        if len(email_key) >= MIN_EMAIL_PREFIX: # Prefix until the user stops typing; includes the exact match
+            conditions |= _key_prefix('email_key', email_key)
+    if not conditions:
+        return Customer.objects.none()
+    return Customer.objects.filter(conditions).order_by('name', 'pk')[:limit]
+
+
+def find_duplicate_clusters(ignore_names=False):
+    """
+    Groups of customers that are the same person, oldest first in each group.
+
+    Customers are linked when they share a phone or email key and, unless
+    `ignore_names` is set, their normalized names are equal too (families
+    and offices often share one phone number). Links are transitive.
+    """
+    blocks = []
+    for key in ('phone_key', 'email_key'):
+        shared = (Customer.objects.exclude(**{key: ''}).values(key)
+                  .annotate(n=Count('pk')).filter(n__gt=1).values(key))
+        rows = Customer.objects.filter(**{f'{key}__in': shared}).values_list(key, 'pk', 'name').order_by(key, 'pk')
+        block = defaultdict(list)
+        for value, pk, name in rows.iterator(chunk_size=2000):
+            block[(value, None if ignore_names else normalize_name(name))].append(pk)
+        blocks.extend(pks for pks in block.values() if len(pks) > 1)
+
+    # Union-find over the blocks, so A~B by phone and B~C by email is one cluster
+    parent = {}
+
+    def find(pk):
+        parent.setdefault(pk, pk)
+        while parent[pk] != pk:
+            parent[pk] = parent[parent[pk]]
+            pk = parent[pk]
+        return pk
+
+    for pks in blocks:
+        root = find(pks[0])
+        for pk in pks[1:]:
+            other = find(pk)
+            if other != root:
+                parent[max(root, other)] = min(root, other)
+                root = min(root, other)
+
+    clusters = defaultdict(list)
+    for pk in parent:
+        clusters[find(pk)].append(pk)
+    return sorted(sorted(pks) for pks in clusters.values())
+
+
+def _case(field, mapping):
+    return Case(*[When(**{field: old}, then=Value(new)) for old, new in mapping.items()])
+
+
+CONTACT_FIELDS = ['phone_number', 'email', 'location_notes', 'latitude', 'longitude']
+
+
+@transaction.atomic
+def merge_clusters(clusters):
+    """
+    Merges each cluster into its first (oldest) customer: orders, archived
+    orders and archive summaries move over in bulk, counters are added up
+    with F() while the cluster's rows are locked, blank contact fields are
+    filled from the duplicates, and the duplicates are deleted. Returns the
+    number of customers removed.
+    """
+    survivor_of = {pk: pks[0] for pks in clusters for pk in pks[1:]}
+    if not survivor_of:
+        return 0
+    # Locked, so orders can't change the counters of a cluster while it is merged
+    customers = Customer.objects.select_for_update().in_bulk([pk for pks in clusters for pk in pks])
+
+    Order.objects.filter(customer_id__in=survivor_of).update(customer_id=_case('customer_id', survivor_of))
+    ArchivedOrder.objects.filter(customer_id__in=survivor_of).update(customer_id=_case('customer_id', survivor_of))
+
+    # Summaries are unique per (month, customer, status): re-add them under the survivor
+    summaries = OrderArchiveSummary.objects.filter(customer_id__in=customers)
+    totals = defaultdict(lambda: [0, Decimal('0'), Decimal('0')])
+    for row in summaries:
+        total = totals[(row.month, survivor_of.get(row.customer_id, row.customer_id), row.status)]
+        total[0] += row.order_count
+        total[1] += row.total_amount
+        total[2] += row.amount_paid
+    summaries.delete()
+    OrderArchiveSummary.objects.bulk_create([
+        OrderArchiveSummary(month=month, customer_id=customer_id, status=status,
+                            order_count=count, total_amount=amount, amount_paid=paid)
+        for (month, customer_id, status), (count, amount, paid) in totals.items()
+    ], batch_size=1000)
+
+    survivors = []
+    added = {} # survivor pk -> (balance_due, lifetime_spend) moved over from its duplicates
+    for pks in clusters:
+        survivor = customers[pks[0]]
+        duplicates = [customers[pk] for pk in pks[1:]]
+        added[survivor.pk] = (sum(d.balance_due for d in duplicates), sum(d.lifetime_spend for d in duplicates))
+        for duplicate in duplicates:
+            for field in CONTACT_FIELDS:
+                if getattr(survivor, field) in (None, '') and getattr(duplicate, field) not in (None, ''):
+                    setattr(survivor, field, getattr(duplicate, field))
+        survivor.phone_key = normalize_phone(survivor.phone_number)
+        survivor.email_key = normalize_email(survivor.email)
+        survivors.append(survivor)
+    # Counters only ever move with F(), like every other counter update (inventory.counters)
+    money = DecimalField(max_digits=14, decimal_places=2)
+    Customer.objects.filter(pk__in=added).update(
+        balance_due=F('balance_due') + Case(*[When(pk=pk, then=Value(due)) for pk, (due, _) in added.items()], output_field=money),
+        lifetime_spend=F('lifetime_spend') + Case(*[When(pk=pk, then=Value(spend)) for pk, (_, spend) in added.items()], output_field=money),
+    )
+    Customer.objects.bulk_update(survivors, ['phone_key', 'email_key', *CONTACT_FIELDS], batch_size=500)
+    Customer.objects.filter(pk__in=survivor_of).delete()
+    return len(survivor_of)
@@ -0,0 +1,49 @@
+"""
+Outbox handlers for order events (see inventory.outbox).
+
+Payloads, as written by the order views:
+  order.created / order.updated: customer, status, total_amount, products (ids on the order, plus any just removed)
+  order.deleted: the same, as the order was just before deletion
+"""
+import logging
+
+from django.conf import settings
+from django.core.mail import send_mail
+
+from .models import Order, Product
+from .outbox import handler
+
+logger = logging.getLogger(__name__)
+
+
+def order_event_payload(order, removed=()):
+    """Payload for order events; `removed` adds the products of lines taken off the order."""
+    products = {item.product_id for item in order.items.all()} | {item.product_id for item in removed}
+    return {'customer': order.customer_id, 'status': order.status, 'total_amount': str(order.total_amount), 'products': sorted(products)}
+
+
+@handler('order.created')
+@handler('order.updated')
+@handler('order.deleted')
+def low_stock_alert(event):
+    """Warns about products on the order that are at or below LOW_STOCK_THRESHOLD."""
+    threshold = getattr(settings, 'LOW_STOCK_THRESHOLD', 5)
+    for product in Product.objects.filter(pk__in=event.payload.get('products', []), stock_quantity__lte=threshold):
+        logger.warning("Low stock: %s has %s left (order #%s)", product.name, product.stock_quantity, event.order_key)
+
+
+@handler('order.created')
+def send_receipt(event):
+    """Emails the customer a receipt when SEND_ORDER_RECEIPTS is on and they have an address."""
+    if not getattr(settings, 'SEND_ORDER_RECEIPTS', False):
+        return
+    order = Order.objects.filter(pk=event.order_key).select_related('customer').first()
+    if order is None or not order.customer.email: # Deleted since, or nowhere to send it
+        return
+    lines = [f"{item.quantity} x {item.product.name} @ {item.price_at_order}" for item in order.items.select_related('product')]
+    send_mail(
+        f"Your order #{order.pk}",
+        "\n".join([f"Thank you for your order, {order.customer.name}.", "", *lines, "",
+                   f"Total: {order.total_amount}", f"Paid: {order.amount_paid}", f"Due: {order.get_amount_due()}"]),
+        None, [order.customer.email],
+    )
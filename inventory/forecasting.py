@@ -0,0 +1,137 @@
+"""
+Sales velocity and demand forecasting for the whole catalogue at once.
+
+Daily unit sales come from one grouped query per order table and are laid
+out as a dense products x days NumPy matrix; every statistic below is then
+computed for all products together with array operations.
+
+Requires NumPy (pip install numpy).
+"""
+from datetime import timedelta
+from statistics import NormalDist
+
+import numpy as np
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import Product, OrderItem, ArchivedOrderItem, ProductForecast
+
+
+def daily_sales_matrix(days, end=None, product_ids=None):
+    """
+    Returns (product_ids, start_date, matrix) where matrix[i, d] is the units
+    of product_ids[i] sold on start_date + d. Cancelled orders are ignored.
+    `product_ids` must be sorted; by default every product is used. Sales of
+    other products (e.g. created since the ids were read) are left out.
+    """
+    if days < 1:
+        raise ValueError("days must be at least 1.")
+    end = end or timezone.localdate()
+    start = end - timedelta(days=days - 1)
+    if product_ids is None:
+        product_ids = Product.objects.order_by('pk').values_list('pk', flat=True)
+    product_ids = np.asarray(product_ids, dtype=np.int64)
+    matrix = np.zeros((len(product_ids), days), dtype=np.float64)
+
+    for model in (OrderItem, ArchivedOrderItem): # Old orders may already be archived
+        rows = list(
+            model.objects.filter(order__order_date__date__gte=start, order__order_date__date__lte=end)
+            .exclude(order__status='CANCELLED')
+            .annotate(day=TruncDate('order__order_date'))
+            .values_list('product_id', 'day')
+            .annotate(units=Sum('quantity'))
+        )
+        if not rows:
+            continue
+        ids = np.fromiter((row[0] for row in rows), dtype=np.int64, count=len(rows))
+        day_index = np.fromiter(((row[1] - start).days for row in rows), dtype=np.int64, count=len(rows))
+        units = np.fromiter((row[2] for row in rows), dtype=np.float64, count=len(rows))
+        rows_index = np.searchsorted(product_ids, ids)
+        known = rows_index < len(product_ids)
+        known[known] = product_ids[rows_index[known]] == ids[known]
+        np.add.at(matrix, (rows_index[known], day_index[known]), units[known])
+
+    return product_ids, start, matrix
+
+
+def moving_average(matrix, window):
+    """Mean of the last `window` days for every product."""
+    window = min(window, matrix.shape[1])
+    return matrix[:, -window:].mean(axis=1)
+
+
+def exponential_smoothing(matrix, alpha):
+    """
+    Simple exponential smoothing run across the day axis. Returns the final
+    level and the one-step-ahead forecast errors (for safety stock).
+    """
+    level = matrix[:, 0].copy()
+    errors = np.empty_like(matrix)
+    errors[:, 0] = 0.0
+    for day in range(1, matrix.shape[1]):
+        errors[:, day] = matrix[:, day] - level
+        level += alpha * errors[:, day]
+    return level, errors
+
+
+def weekday_factors(matrix, start):
+    """Demand multiplier per weekday (Monday first), 1.0 where there is no history."""
+    weekdays = (start.weekday() + np.arange(matrix.shape[1])) % 7
+    factors = np.ones((matrix.shape[0], 7))
+    overall = matrix.mean(axis=1)
+    selling = overall > 0
+    for weekday in range(7):
+        columns = weekdays == weekday
+        if columns.any():
+            factors[selling, weekday] = matrix[selling][:, columns].mean(axis=1) / overall[selling]
+    return factors
+
+
+def build_forecasts(days=180, alpha=0.3, lead_time_days=7, review_days=7, service_level=0.95, end=None):
+    """Computes unsaved ProductForecast objects for every product."""
+    end = end or timezone.localdate()
+    # Ids and stock from one query, so the arrays stay aligned if products are added meanwhile
+    products = list(Product.objects.order_by('pk').values_list('pk', 'stock_quantity'))
+    if not products:
+        return []
+    stock = np.array([quantity for _, quantity in products], dtype=np.float64)
+    product_ids, start, matrix = daily_sales_matrix(days, end, [pk for pk, _ in products])
+
+    ma7 = moving_average(matrix, 7)
+    ma28 = moving_average(matrix, 28)
+    level, errors = exponential_smoothing(matrix, alpha)
+    factors = weekday_factors(matrix, start)
+
+    # Demand over the lead time, following the weekly pattern of the days ahead
+    ahead = (end.weekday() + 1 + np.arange(lead_time_days)) % 7
+    lead_demand = level * factors[:, ahead].sum(axis=1)
+    z = NormalDist().inv_cdf(service_level)
+    safety_stock = z * errors[:, 1:].std(axis=1) * np.sqrt(lead_time_days) if matrix.shape[1] > 1 else np.zeros(len(level))
+    reorder_point = lead_demand + safety_stock
+    # Order enough to cover lead time plus one review period above current stock
+    suggested = np.maximum(0, np.ceil(reorder_point + level * review_days - stock)).astype(np.int64)
+    suggested[stock > reorder_point] = 0 # Nothing to order until stock falls to the reorder point
+
+    computed_at = timezone.now()
+    return [
+        ProductForecast(
+            product_id=int(product_ids[i]), computed_at=computed_at,
+            avg_daily_7=float(ma7[i]), avg_daily_28=float(ma28[i]), smoothed_daily=float(level[i]),
+            weekday_factors=[round(float(f), 3) for f in factors[i]],
+            forecast_lead_time=float(lead_demand[i]), safety_stock=float(safety_stock[i]),
+            reorder_point=float(reorder_point[i]), suggested_order_quantity=int(suggested[i]),
+        )
+        for i in range(len(product_ids))
+    ]
+
+
+def refresh_forecasts(**options):
+    """Recomputes and upserts the forecast table. Returns the number of products."""
+    forecasts = build_forecasts(**options)
+    ProductForecast.objects.bulk_create(
+        forecasts, batch_size=1000,
+        update_conflicts=True, unique_fields=['product'],
+        update_fields=[field.name for field in ProductForecast._meta.concrete_fields if field.name not in ('id', 'product')],
+    )
+    return len(forecasts)
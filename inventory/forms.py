@@ -1,5 +1,9 @@
 from django import forms
-from .models import Product, Category, Customer, Order, OrderItem
+from django.db.models import Prefetch
+from django.utils.functional import cached_property
+from crispy_forms.helper import FormHelper
+from .models import Product, Category, Customer, Order, OrderItem, LocationStock
+from .dedup import matching_customers
 
 class CategoryForm(forms.ModelForm):
     class Meta:
@@ -20,7 +24,7 @@ class ProductForm(forms.ModelForm):
 class CustomerForm(forms.ModelForm):
     class Meta:
         model = Customer
-        fields = ['name', 'phone_number', 'email', 'address', 'location_notes']
+        fields = ['name', 'phone_number', 'email', 'address', 'location_notes', 'latitude', 'longitude']
         widgets = {
             'address': forms.Textarea(attrs={'rows': 3}),
              'location_notes': forms.Textarea(attrs={'rows': 2}),
@@ -28,13 +32,37 @@ class CustomerForm(forms.ModelForm):
 
 # Quick Customer form (maybe fewer fields initially)
 class QuickCustomerForm(forms.ModelForm):
-     class Meta:
+    create_anyway = forms.BooleanField(
+        required=False, label="This is a different person - create anyway",
+        help_text="Only shown when the phone number or email already belongs to a customer.",
+    )
+
+    class Meta:
         model = Customer
-        fields = ['name', 'phone_number', 'address'] # Start with essential fields
+        fields = ['name', 'phone_number', 'email', 'address'] # Start with essential fields
         widgets = {
             'address': forms.Textarea(attrs={'rows': 2}),
         }
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.matches = []
+        self.fields['create_anyway'].widget = forms.HiddenInput() # Shown by clean() when needed
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('create_anyway'):
+            # Same normalized phone or email as an existing customer: probably a duplicate
+            self.matches = list(matching_customers(cleaned_data.get('phone_number'), cleaned_data.get('email'), exact=True))
+            if self.matches:
+                self.fields['create_anyway'].widget = forms.CheckboxInput()
+                raise forms.ValidationError(
+                    "A customer with this phone number or email already exists: %(names)s. "
+                    "Use the existing customer, or tick the box below if this is someone else.",
+                    params={'names': ', '.join(f"{c.name} (#{c.pk})" for c in self.matches)},
+                )
+        return cleaned_data
+
 class OrderForm(forms.ModelForm):
     class Meta:
         model = Order
@@ -54,10 +82,48 @@ class OrderItemForm(forms.ModelForm):
         model = OrderItem
         fields = ['product', 'quantity']
 
-    # Optional: Filter product choices, e.g., show only in-stock items
-    # def __init__(self, *args, **kwargs):
-    #     super().__init__(*args, **kwargs)
-    #     self.fields['product'].queryset = Product.objects.filter(stock_quantity__gt=0).order_by('name')
+    # Used by {% crispy item_formset item_formset.form.helper %}: a compact table, one row per item.
+    # The surrounding <form> and CSRF token come from order_form.html.
+    helper = FormHelper()
+    helper.form_tag = False
+    helper.disable_csrf = True
+    helper.template = 'bootstrap5/table_inline_formset.html'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Product labels include the category name, so fetch it in the same query
+        self.fields['product'].queryset = Product.objects.select_related('category').order_by('name')
+
+
+class BaseOrderItemFormSet(forms.BaseInlineFormSet):
+    """
+    Builds the product choices once and shares them between all item forms
+    (and the empty form), instead of one product query per rendered row.
+    """
+
+    @cached_property
+    def product_choices(self):
+        # Labels show total and per-location stock, e.g. "Pen (Writing) - 12 in stock: Shop 5, Storeroom 7"
+        products = (Product.objects.select_related('category').order_by('name')
+                    .prefetch_related(Prefetch('location_stock', queryset=LocationStock.objects.select_related('location'))))
+        choices = [('', '---------')]
+        for product in products:
+            per_location = ', '.join(f"{row.location.name} {row.quantity}" for row in product.location_stock.all() if row.quantity)
+            choices.append((product.pk, f"{product} - {product.stock_quantity} in stock"
+                                        + (f": {per_location}" if per_location else '')))
+        return choices
+
+    def _share_product_choices(self, form):
+        # A callable keeps the choices lazy, so POSTs that aren't re-rendered never build them
+        form.fields['product'].choices = lambda: self.product_choices
+        return form
+
+    def _construct_form(self, i, **kwargs):
+        return self._share_product_choices(super()._construct_form(i, **kwargs))
+
+    @property
+    def empty_form(self):
+        return self._share_product_choices(super().empty_form)
 
 
 # Formset for handling multiple OrderItems within an Order view
@@ -65,7 +131,59 @@ OrderItemFormSet = forms.inlineformset_factory(
     Order,       # Parent model
     OrderItem,   # Child model
     form=OrderItemForm, # Form to use for each item
+    formset=BaseOrderItemFormSet, # Shares product choices between forms
     fields=('product', 'quantity'), # Fields to include in the formset
     extra=1,      # Number of empty forms to display
     can_delete=True # Allow deleting items from the order
-)
\ No newline at end of file
+)
+
+
+class DeliveryPlanForm(forms.Form):
+    date = forms.DateField(widget=forms.DateInput(attrs={'type': 'date'}))
+    drivers = forms.IntegerField(min_value=1, max_value=50, initial=1)
+    depot_latitude = forms.DecimalField(max_digits=9, decimal_places=6, required=False,
+                                        help_text="Defaults to settings.STORE_LOCATION")
+    depot_longitude = forms.DecimalField(max_digits=9, decimal_places=6, required=False)
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if (cleaned_data.get('depot_latitude') is None) != (cleaned_data.get('depot_longitude') is None):
+            raise forms.ValidationError("Enter both depot coordinates or neither.")
+        return cleaned_data
+
+
+class RepriceForm(forms.Form):
+    CHANGE_TYPE_CHOICES = [
+        ('percent', 'Percentage (%)'),
+        ('amount', 'Fixed amount'),
+    ]
+
+    category = forms.ModelChoiceField(queryset=Category.objects.order_by('name'), required=False,
+                                      help_text="Reprice every product in this category")
+    products = forms.ModelMultipleChoiceField(queryset=Product.objects.order_by('name'), required=False,
+                                              help_text="...or only these products (search by name to add them)")
+    change_type = forms.ChoiceField(choices=CHANGE_TYPE_CHOICES)
+    value = forms.DecimalField(max_digits=10, decimal_places=2,
+                               help_text="Negative values lower prices, e.g. -10 for a 10% discount")
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Only the chosen products are rendered; the page adds more from product_lookup,
+        # so the catalogue is never sent as one long list
+        chosen = [pk for pk in self['products'].value() or [] if str(pk).isdigit()]
+        self.fields['products'].widget.choices = Product.objects.filter(pk__in=chosen).order_by('name').values_list('pk', 'name')
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if not cleaned_data.get('category') and not cleaned_data.get('products'):
+            raise forms.ValidationError("Choose a category or at least one product.")
+        return cleaned_data
+
+    def get_queryset(self):
+        """Products selected by the category and/or product fields."""
+        queryset = Product.objects.all()
+        if self.cleaned_data.get('category'):
+            queryset = queryset.filter(category=self.cleaned_data['category'])
+        if self.cleaned_data.get('products'):
+            queryset = queryset.filter(pk__in=[p.pk for p in self.cleaned_data['products']])
+        return queryset
\ No newline at end of file
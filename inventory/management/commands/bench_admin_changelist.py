@@ -0,0 +1,94 @@
+import time
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from inventory.benchmarking import QueryCounter, rolled_back
+from inventory.models import Category, Product, Customer, Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Seeds a large number of orders inside a transaction, times the admin "
+        "changelists against them, then rolls everything back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--orders', type=int, default=1_000_000)
+        parser.add_argument('--customers', type=int, default=20_000)
+        parser.add_argument('--products', type=int, default=2_000)
+        parser.add_argument('--repeat', type=int, default=5, help="Requests per URL; the median is reported")
+        parser.add_argument('--batch-size', type=int, default=10_000)
+
+    def handle(self, *args, **options):
+        with rolled_back(): # Never keep the generated rows
+            self.seed(options)
+            self.run_benchmarks(options['repeat'])
+        self.stdout.write("Rolled back generated data.")
+
+    def seed(self, options):
+        batch_size = options['batch_size']
+        started = time.perf_counter()
+
+        category = Category.objects.create(name='Benchmark category')
+        Product.objects.bulk_create(
+            (Product(name=f'Bench product {i}', category=category, price=Decimal('1.50'), stock_quantity=1_000)
+             for i in range(options['products'])),
+            batch_size=batch_size,
+        )
+        Customer.objects.bulk_create(
+            (Customer(name=f'Bench customer {i}', phone_number=f'555{i:07d}', address='-')
+             for i in range(options['customers'])),
+            batch_size=batch_size,
+        )
+        customer_ids = list(Customer.objects.values_list('pk', flat=True))
+        product_ids = list(Product.objects.values_list('pk', flat=True))
+
+        for start in range(0, options['orders'], batch_size):
+            stop = min(start + batch_size, options['orders'])
+            orders = Order.objects.bulk_create([
+                Order(customer_id=customer_ids[i % len(customer_ids)], total_amount=Decimal('3.00'))
+                for i in range(start, stop)
+            ])
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product_id=product_ids[order.pk % len(product_ids)], quantity=2, price_at_order=Decimal('1.50'))
+                for order in orders
+            ])
+
+        # Refresh planner statistics so the estimated-count paginator can kick in
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        self.stdout.write(f"Seeded {options['orders']} orders in {time.perf_counter() - started:.1f}s")
+
+    def run_benchmarks(self, repeat):
+        user = get_user_model().objects.create_superuser('bench-admin', 'bench@example.com', 'bench')
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+
+        order_changelist = reverse('admin:inventory_order_changelist')
+        urls = [
+            order_changelist,
+            order_changelist + '?status__exact=PENDING',
+            order_changelist + '?customer_name=Bench+customer+42',
+            order_changelist + '?q=Bench+product+7',
+            reverse('admin:inventory_customer_changelist'),
+            reverse('admin:inventory_product_changelist'),
+            reverse('admin:autocomplete') + '?app_label=inventory&model_name=order&field_name=customer&term=Bench+customer+1',
+        ]
+        for url in urls:
+            timings = []
+            for _ in range(repeat):
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries):
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - started)
+            timings.sort()
+            self.stdout.write(
+                f"{response.status_code} {timings[len(timings) // 2] * 1000:8.1f} ms  "
+                f"{queries.count:3d} queries  {url}"
+            )
@@ -0,0 +1,78 @@
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from inventory.benchmarking import QueryCounter, rolled_back
+from inventory.models import Category, Product, Customer, Order, OrderItem
+
+
+class Command(BaseCommand):
+    help = (
+        "Measures render time, queries and bytes on the wire (plain and gzip) for the "
+        "order form and bill pages under the active settings. Seeded data is rolled back. "
+        "Compare e.g. DJANGO_SETTINGS_MODULE=stationary_store.settings_production "
+        "(with DJANGO_SECRET_KEY set)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=500, help="Size of the product picker")
+        parser.add_argument('--items', type=int, default=5, help="Lines on the benchmark order")
+        parser.add_argument('--repeat', type=int, default=20, help="Requests per page; the median is reported")
+
+    def handle(self, *args, **options):
+        template_options = settings.TEMPLATES[0].get('OPTIONS', {})
+        self.stdout.write(
+            f"DEBUG={settings.DEBUG} "
+            f"cached_loader={'cached.Loader' in str(template_options.get('loaders', 'implicit'))} "
+            f"gzip={'django.middleware.gzip.GZipMiddleware' in settings.MIDDLEWARE}"
+        )
+        with rolled_back():
+            order = self.seed(options)
+            self.run_benchmarks(order, options['repeat'])
+
+    def seed(self, options):
+        category = Category.objects.create(name='Benchmark category')
+        products = Product.objects.bulk_create([
+            Product(name=f'Bench product {i}', category=category, price=Decimal('2.50'), stock_quantity=100)
+            for i in range(options['products'])
+        ])
+        customer = Customer.objects.create(name='Bench customer', address='1 Bench Road')
+        order = Order.objects.create(customer=customer, total_amount=Decimal('2.50') * options['items'])
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product=product, quantity=1, price_at_order=product.price)
+            for product in products[:options['items']]
+        ])
+        return order
+
+    def run_benchmarks(self, order, repeat):
+        user = get_user_model().objects.create_superuser('bench-render', 'bench@example.com', 'bench')
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+
+        pages = [
+            ('order form (new)', reverse('order_create')),
+            ('order form (edit)', reverse('order_update', kwargs={'pk': order.pk})),
+            ('bill', reverse('order_detail', kwargs={'pk': order.pk})),
+        ]
+        for label, url in pages:
+            timings = []
+            for _ in range(repeat):
+                queries = QueryCounter()
+                with connection.execute_wrapper(queries):
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - started)
+            timings.sort()
+            plain = len(response.content)
+            compressed = client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.stdout.write(
+                f"{label:18} {response.status_code} {timings[len(timings) // 2] * 1000:7.1f} ms "
+                f"{queries.count:3d} queries  {plain:7d} B plain  {len(compressed.content):7d} B "
+                f"with Accept-Encoding: gzip ({compressed.get('Content-Encoding', 'identity')})"
+            )
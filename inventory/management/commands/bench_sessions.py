@@ -0,0 +1,69 @@
+import re
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client, override_settings
+
+from inventory.benchmarking import QueryCounter, rolled_back
+
+MODEL_BACKEND = 'django.contrib.auth.backends.ModelBackend'
+CACHED_BACKEND = 'inventory.auth.CachedModelBackend'
+
+CONFIGURATIONS = [
+    ('db sessions, ModelBackend', 'django.contrib.sessions.backends.db', MODEL_BACKEND),
+    ('cached_db sessions, ModelBackend', 'django.contrib.sessions.backends.cached_db', MODEL_BACKEND),
+    ('cached_db sessions, cached user', 'django.contrib.sessions.backends.cached_db', CACHED_BACKEND),
+    ('cache sessions, cached user', 'django.contrib.sessions.backends.cache', CACHED_BACKEND),
+]
+
+
+class TableQueryCounter(QueryCounter):
+    """Counts queries, and separately those on the session and user tables."""
+
+    def __init__(self):
+        super().__init__()
+        self.session = self.user = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        if re.search(r'\bdjango_session\b', sql):
+            self.session += 1
+        elif re.search(r'FROM "auth_user"', sql):
+            self.user += 1
+        return super().__call__(execute, sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        "Counts database queries per authenticated request for each session engine / auth backend "
+        "combination. Uses the configured cache; the test user and sessions are rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', action='append', help="Page to request (repeatable, default /orders/)")
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        paths = options['path'] or ['/orders/']
+        with rolled_back():
+            user = get_user_model().objects.create_user('bench-sessions', password='bench')
+            for label, engine, backend in CONFIGURATIONS:
+                with override_settings(SESSION_ENGINE=engine, AUTHENTICATION_BACKENDS=[backend]):
+                    self.run_configuration(label, user, paths, options['repeat'])
+
+    def run_configuration(self, label, user, paths, repeat):
+        client = Client(HTTP_HOST='localhost')
+        client.force_login(user)
+        for path in paths:
+            client.get(path) # Warm the caches
+            counter = TableQueryCounter()
+            started = time.perf_counter()
+            with connection.execute_wrapper(counter):
+                for _ in range(repeat):
+                    response = client.get(path)
+            elapsed = (time.perf_counter() - started) / repeat
+            self.stdout.write(
+                f"{label:34} {path:12} {response.status_code} {counter.count / repeat:5.1f} queries/request "
+                f"(session {counter.session / repeat:.1f}, user {counter.user / repeat:.1f})  {elapsed * 1000:6.1f} ms"
+            )
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from inventory.dedup import find_duplicate_clusters, merge_clusters
+from inventory.models import Customer
+
+
+class Command(BaseCommand):
+    help = (
+        "Finds customers sharing a normalized phone number or email (and name, unless --ignore-names) "
+        "and merges each group into its oldest record, moving orders over in bulk."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="List the groups without changing anything")
+        parser.add_argument('--ignore-names', action='store_true', help="Link customers on phone/email alone")
+        parser.add_argument('--batch-size', type=int, default=200, help="Duplicates merged per transaction")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        clusters = find_duplicate_clusters(ignore_names=options['ignore_names'])
+        duplicates = sum(len(pks) - 1 for pks in clusters)
+        self.stdout.write(f"Found {len(clusters)} groups with {duplicates} duplicates in {time.perf_counter() - started:.2f}s.")
+
+        if options['dry_run']:
+            names = dict(Customer.objects.filter(pk__in=[pk for pks in clusters for pk in pks]).values_list('pk', 'name'))
+            for pks in clusters:
+                self.stdout.write(f"  keep #{pks[0]} {names[pks[0]]}  <-  " + ", ".join(f"#{pk} {names[pk]}" for pk in pks[1:]))
+            return
+
+        merged = 0
+        batch = []
+        for pks in clusters:
+            batch.append(pks)
+            if sum(len(group) - 1 for group in batch) >= options['batch_size']:
+                merged += merge_clusters(batch)
+                batch = []
+        merged += merge_clusters(batch)
+        self.stdout.write(self.style.SUCCESS(
+            f"Merged {merged} duplicate customers into {len(clusters)} records ({time.perf_counter() - started:.1f}s)."
+        ))
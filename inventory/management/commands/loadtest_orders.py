@@ -0,0 +1,241 @@
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from http.cookiejar import CookieJar
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Sum
+
+from inventory.models import Category, Product, Customer, Order, OrderItem, LocationStock
+from inventory.stock import default_location
+
+LOADTEST_PREFIX = 'Loadtest'
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    # Keep 302s visible: the Location header of a successful order POST holds the new pk
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class StoreClient:
+    """A logged-in browser session against the live server, using only the standard library."""
+
+    def __init__(self, base_url, username, password):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = CookieJar()
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect)
+        self.request('GET', '/accounts/login/')
+        status, _ = self.request('POST', '/accounts/login/', {'username': username, 'password': password})
+        if status != 302:
+            raise CommandError(f"Login as {username} failed with HTTP {status}.")
+
+    def csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def request(self, method, path, data=None):
+        """Returns (status, Location header) for the request."""
+        body = None
+        if method == 'POST':
+            data = dict(data or {}, csrfmiddlewaretoken=self.csrf_token())
+            body = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(self.base_url + path, data=body, method=method,
+                                         headers={'Referer': self.base_url + path})
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                response.read()
+                return response.status, response.headers.get('Location')
+        except urllib.error.HTTPError as error:
+            error.read()
+            return error.code, error.headers.get('Location')
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs concurrent order create/edit/delete traffic against a live server "
+        "(python manage.py runserver, gunicorn, ...) and then checks that every test "
+        "product's stock_quantity equals initial stock minus the quantity still on orders "
+        "and the sum of its per-location stock. "
+        "The server and this command must use the same DATABASES settings "
+        "(run it once with SQLite and once with PostgreSQL settings to compare)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000')
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--ops', type=int, default=50, help="Operations per thread")
+        parser.add_argument('--products', type=int, default=5, help="Few products means more contention")
+        parser.add_argument('--stock', type=int, default=100_000)
+        parser.add_argument('--mix', default='60,25,15', help="create,edit,delete weights")
+        parser.add_argument('--seed', type=int, default=None)
+        parser.add_argument('--keep', action='store_true', help="Keep the generated orders and products")
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        weights = [int(w) for w in options['mix'].split(',')]
+        if len(weights) != 3:
+            raise CommandError("--mix takes three weights: create,edit,delete")
+
+        username, password = self.setup_data(options)
+        self.orders = [] # pks of live orders created by this run
+        self.lock = threading.Lock()
+        self.results = [] # (operation, outcome, seconds)
+
+        clients = [StoreClient(options['url'], username, password) for _ in range(options['threads'])]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            for future in [pool.submit(self.worker, client, options['ops'], weights, i) for i, client in enumerate(clients)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+
+        self.report(elapsed)
+        drift = self.verify()
+        if not options['keep']:
+            self.cleanup()
+        if drift:
+            raise CommandError(f"Stock drift detected on {drift} products.")
+
+    def setup_data(self, options):
+        user_model = get_user_model()
+        username, password = 'loadtest', 'loadtest-password'
+        user, _ = user_model.objects.get_or_create(username=username)
+        user.set_password(password)
+        user.save()
+
+        category, _ = Category.objects.get_or_create(name=f'{LOADTEST_PREFIX} category')
+        self.customer, _ = Customer.objects.get_or_create(name=f'{LOADTEST_PREFIX} customer', defaults={'address': '-'})
+        run = int(time.time())
+        self.products = Product.objects.bulk_create([
+            Product(name=f'{LOADTEST_PREFIX} {run} #{i}', category=category, price=Decimal('1.00'), stock_quantity=options['stock'])
+            for i in range(options['products'])
+        ])
+        # Re-read so we have pks on every backend
+        self.products = list(Product.objects.filter(name__startswith=f'{LOADTEST_PREFIX} {run} #'))
+        # Orders take stock per location, so the opening stock must sit in one
+        location = default_location()
+        LocationStock.objects.bulk_create([
+            LocationStock(product=product, location=location, quantity=product.stock_quantity) for product in self.products
+        ])
+        self.initial_stock = {product.pk: product.stock_quantity for product in self.products}
+        return username, password
+
+    def worker(self, client, ops, weights, seed):
+        rng = random.Random(self.random.random() + seed)
+        for _ in range(ops):
+            operation = rng.choices(['create', 'edit', 'delete'], weights)[0]
+            started = time.perf_counter()
+            outcome = getattr(self, f'do_{operation}')(client, rng)
+            with self.lock:
+                self.results.append((operation, outcome, time.perf_counter() - started))
+
+    def _order_data(self, lines, initial_forms=0):
+        data = {
+            'customer': self.customer.pk, 'amount_paid': '0', 'status': 'PENDING', 'notes': '',
+            'items-TOTAL_FORMS': len(lines), 'items-INITIAL_FORMS': initial_forms,
+            'items-MIN_NUM_FORMS': 0, 'items-MAX_NUM_FORMS': 1000,
+        }
+        for i, line in enumerate(lines):
+            for key, value in line.items():
+                data[f'items-{i}-{key}'] = value
+        return data
+
+    def do_create(self, client, rng):
+        products = rng.sample(self.products, k=rng.randint(1, min(3, len(self.products))))
+        lines = [{'product': product.pk, 'quantity': rng.randint(1, 5)} for product in products]
+        status, location = client.request('POST', '/orders/new/', self._order_data(lines))
+        if status == 200:
+            return 'rejected' # Form re-rendered, e.g. not enough stock
+        if status != 302:
+            return f'http {status}'
+        with self.lock:
+            self.orders.append(int(location.rstrip('/').rsplit('/', 1)[1]))
+        return 'ok'
+
+    def do_edit(self, client, rng):
+        with self.lock:
+            if not self.orders:
+                return 'skipped'
+            pk = rng.choice(self.orders)
+        items = list(OrderItem.objects.filter(order_id=pk).values_list('pk', 'product_id'))
+        if not items:
+            return 'conflict' # Deleted concurrently
+        lines = [
+            {'id': item_pk, 'order': pk, 'product': product_id, 'quantity': rng.randint(1, 5)}
+            for item_pk, product_id in items
+        ]
+        unused = [p for p in self.products if p.pk not in {product_id for _, product_id in items}]
+        if unused and rng.random() < 0.3:
+            lines.append({'product': rng.choice(unused).pk, 'quantity': rng.randint(1, 5)})
+        if len(items) > 1 and rng.random() < 0.3:
+            lines[0]['DELETE'] = 'on'
+        status, _ = client.request('POST', f'/orders/{pk}/edit/', self._order_data(lines, initial_forms=len(items)))
+        return {302: 'ok', 200: 'rejected', 404: 'conflict'}.get(status, f'http {status}')
+
+    def do_delete(self, client, rng):
+        with self.lock:
+            if not self.orders:
+                return 'skipped'
+            pk = self.orders.pop(rng.randrange(len(self.orders)))
+        status, _ = client.request('POST', f'/orders/{pk}/delete/')
+        return 'ok' if status == 302 else f'http {status}'
+
+    def report(self, elapsed):
+        done = [r for r in self.results if r[1] != 'skipped']
+        self.stdout.write(f"{len(done)} requests in {elapsed:.1f}s = {len(done) / elapsed:.1f} req/s")
+        for operation in ('create', 'edit', 'delete'):
+            latencies = sorted(seconds for op, outcome, seconds in done if op == operation)
+            if not latencies:
+                continue
+            outcomes = {}
+            for op, outcome, _ in done:
+                if op == operation:
+                    outcomes[outcome] = outcomes.get(outcome, 0) + 1
+
+            def pct(p):
+                return latencies[min(len(latencies) - 1, int(p / 100 * len(latencies)))] * 1000
+
+            self.stdout.write(
+                f"  {operation:6} n={len(latencies):5d}  p50={pct(50):7.1f} ms  p95={pct(95):7.1f} ms  "
+                f"p99={pct(99):7.1f} ms  max={latencies[-1] * 1000:7.1f} ms  {outcomes}"
+            )
+
+    def verify(self):
+        """
+        Compares each product's stock with initial stock minus what is still on
+        orders, and with the sum of its per-location stock, which must not be negative.
+        """
+        on_orders = dict(
+            OrderItem.objects.filter(product__in=self.products)
+            .values_list('product').annotate(total=Sum('quantity'))
+        )
+        per_location = dict(
+            LocationStock.objects.filter(product__in=self.products)
+            .values_list('product').annotate(total=Sum('quantity'))
+        )
+        negative = set(LocationStock.objects.filter(product__in=self.products, quantity__lt=0).values_list('product', flat=True))
+        drift = 0
+        for product in Product.objects.filter(pk__in=self.initial_stock).order_by('pk'):
+            expected = self.initial_stock[product.pk] - on_orders.get(product.pk, 0)
+            problems = []
+            if product.stock_quantity != expected:
+                problems.append(f"stock {product.stock_quantity}, expected {expected} (drift {product.stock_quantity - expected:+d})")
+            if per_location.get(product.pk, 0) != product.stock_quantity:
+                problems.append(f"locations hold {per_location.get(product.pk, 0)}, total says {product.stock_quantity}")
+            if product.pk in negative:
+                problems.append("negative stock at a location")
+            if problems:
+                drift += 1
+                self.stdout.write(self.style.ERROR(f"  {product.name}: {'; '.join(problems)}"))
+        if not drift:
+            self.stdout.write(self.style.SUCCESS(f"Stock consistent for all {len(self.initial_stock)} products."))
+        return drift
+
+    def cleanup(self):
+        Order.objects.filter(customer=self.customer).delete()
+        Product.objects.filter(pk__in=self.initial_stock).delete()
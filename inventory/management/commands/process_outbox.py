@@ -0,0 +1,53 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from inventory.outbox import HANDLERS, load_handlers, process_batch, purge_processed
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the handlers for pending outbox events (receipts, stock alerts, ...) on a thread pool. "
+        "Polls until interrupted unless --once is given. Run only one instance."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help="Threads; each handles one order's events at a time")
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--max-attempts', type=int, default=5, help="Mark an event Failed after this many errors")
+        parser.add_argument('--retry-delay', type=float, default=10, help="Seconds before the first retry; doubles each time")
+        parser.add_argument('--poll-interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty")
+        parser.add_argument('--keep-days', type=int, default=7, help="Delete handled events older than this")
+        parser.add_argument('--once', action='store_true', help="Exit when no events are due")
+
+    def handle(self, *args, **options):
+        load_handlers()
+        if options['verbosity'] > 1:
+            for event_type, funcs in sorted(HANDLERS.items()):
+                self.stdout.write(f"{event_type}: {', '.join(f.__name__ for f in funcs)}")
+
+        total_done = total_failed = 0
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            try:
+                while True:
+                    done, failed = process_batch(pool, options['batch_size'], options['max_attempts'], options['retry_delay'])
+                    total_done += done
+                    total_failed += failed
+                    if done or failed:
+                        if options['verbosity'] > 1:
+                            self.stdout.write(f"Handled {done} events, {failed} failed")
+                        continue
+                    purge_processed(timezone.now() - timedelta(days=options['keep_days']))
+                    if options['once']:
+                        break
+                    time.sleep(options['poll_interval'])
+            except KeyboardInterrupt:
+                pass
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Handled {total_done} events ({total_failed} failures) in {time.perf_counter() - started:.1f}s."
+        ))
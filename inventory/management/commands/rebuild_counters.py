@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inventory.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = "Recomputes the denormalized product sales and customer balance counters to repair drift."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_counters()
+        self.stdout.write(self.style.SUCCESS("Product and customer counters rebuilt."))
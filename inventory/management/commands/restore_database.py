@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from inventory.backup import load_manifest, restore_logical, restore_sqlite
+
+
+class Command(BaseCommand):
+    help = (
+        "Restores a backup made by backup_database, replacing ALL data in the database. "
+        "Checksums are verified before anything is overwritten. Stop the web server first."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('backup', help="Manifest path, or the backup name inside BACKUP_DIR")
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+        parser.add_argument('--batch-size', type=int, default=2000, help="Rows per INSERT for logical restores")
+        parser.add_argument('--pages', type=int, default=1024, help="Pages per step for SQLite restores")
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive')
+
+    def handle(self, *args, **options):
+        try:
+            manifest = load_manifest(options['backup'])
+        except FileNotFoundError:
+            raise CommandError(f"No backup named {options['backup']}.")
+
+        if options['interactive']:
+            answer = input(f"This replaces all data in '{options['database']}' with {manifest['name']} "
+                           f"({manifest['created']}). Type 'yes' to continue: ")
+            if answer != 'yes':
+                raise CommandError("Restore cancelled.")
+
+        try:
+            if manifest['format'] == 'sqlite-chunks':
+                stats = restore_sqlite(manifest, options['database'], options['pages'])
+            else:
+                stats = restore_logical(manifest, options['database'], options['batch_size'])
+        except ValueError as error: # Checksum mismatch or wrong database type; nothing was overwritten
+            raise CommandError(str(error))
+
+        self.stdout.write(self.style.SUCCESS(f"Restored {manifest['name']} into '{options['database']}'."))
+        self.stdout.write(f"  {stats}")
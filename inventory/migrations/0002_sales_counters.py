@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='balance_due',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0.0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='lifetime_spend',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='revenue',
+            field=models.DecimalField(decimal_places=2, default=0.0, editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.IntegerField(db_index=True, default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_price_history'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='latitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='longitude',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=9, null=True),
+        ),
+        migrations.AlterField(
+            model_name='customer',
+            name='location_notes',
+            field=models.CharField(blank=True, help_text='Optional: Landmarks, specific instructions', max_length=255, null=True),
+        ),
+    ]
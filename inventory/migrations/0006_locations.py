@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_shop_stock(apps, schema_editor):
+    """Puts all existing stock into a default 'Shop' location."""
+    Location = apps.get_model('inventory', 'Location')
+    LocationStock = apps.get_model('inventory', 'LocationStock')
+    Product = apps.get_model('inventory', 'Product')
+    shop, _ = Location.objects.get_or_create(name='Shop', defaults={'priority': 0})
+    LocationStock.objects.bulk_create(
+        [LocationStock(product_id=pk, location=shop, quantity=quantity)
+         for pk, quantity in Product.objects.values_list('pk', 'stock_quantity').iterator()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_order_archive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Location',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('priority', models.PositiveIntegerField(default=0, help_text='Orders are allocated from the lowest number first')),
+                ('is_active', models.BooleanField(default=True)),
+            ],
+            options={
+                'ordering': ['priority', 'name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='orderitem',
+            name='location',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='inventory.location'),
+        ),
+        migrations.CreateModel(
+            name='LocationStock',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(default=0)),
+                ('location', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock', to='inventory.location')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='location_stock', to='inventory.product')),
+            ],
+            options={
+                'unique_together': {('product', 'location')},
+            },
+        ),
+        migrations.RunPython(create_shop_stock, migrations.RunPython.noop),
+    ]
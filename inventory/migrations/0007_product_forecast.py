@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0006_locations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductForecast',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('computed_at', models.DateTimeField()),
+                ('avg_daily_7', models.FloatField(help_text='Average units sold per day over the last 7 days')),
+                ('avg_daily_28', models.FloatField(help_text='Average units sold per day over the last 28 days')),
+                ('smoothed_daily', models.FloatField(help_text='Exponentially smoothed daily demand')),
+                ('weekday_factors', models.JSONField(default=list, help_text='Demand multiplier per weekday, Monday first')),
+                ('forecast_lead_time', models.FloatField(help_text='Expected units sold during the supplier lead time')),
+                ('safety_stock', models.FloatField()),
+                ('reorder_point', models.FloatField()),
+                ('suggested_order_quantity', models.IntegerField(db_index=True, default=0)),
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='forecast', to='inventory.product')),
+            ],
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:41
+
+from django.db import migrations, models
+
+from inventory.normalize import normalize_phone, normalize_email
+
+
+def fill_contact_keys(apps, schema_editor):
+    """Computes phone_key/email_key for existing customers."""
+    Customer = apps.get_model('inventory', 'Customer')
+    batch = []
+    for customer in Customer.objects.only('phone_number', 'email').iterator(chunk_size=1000):
+        customer.phone_key = normalize_phone(customer.phone_number)
+        customer.email_key = normalize_email(customer.email)
+        batch.append(customer)
+        if len(batch) == 1000:
+            Customer.objects.bulk_update(batch, ['phone_key', 'email_key'])
+            batch = []
+    Customer.objects.bulk_update(batch, ['phone_key', 'email_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='email_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=254),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='phone_key',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=20),
+        ),
+        migrations.RunPython(fill_contact_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:48
+
+import django.core.serializers.json
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0009_customer_contact_keys'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuditLogEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('model', models.CharField(max_length=50)),
+                ('object_id', models.BigIntegerField()),
+                ('order_key', models.BigIntegerField(blank=True, null=True)),
+                ('action', models.CharField(choices=[('CREATE', 'Created'), ('UPDATE', 'Updated'), ('DELETE', 'Deleted')], max_length=10)),
+                ('changes', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='{field: [before, after]}')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Audit log entries',
+                'indexes': [models.Index(fields=['order_key', 'timestamp'], name='inventory_a_order_k_4d411c_idx'), models.Index(fields=['model', 'object_id', 'timestamp'], name='inventory_a_model_2971ad_idx'), models.Index(fields=['user', 'timestamp'], name='inventory_a_user_id_50e44d_idx')],
+            },
+        ),
+    ]
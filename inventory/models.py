@@ -2,6 +2,10 @@ from django.db import models
 from django.urls import reverse
 from django.core.validators import MinValueValidator
 from django.conf import settings # To link to the User model
+from django.utils import timezone
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .normalize import normalize_phone, normalize_email
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -16,12 +20,28 @@ class Category(models.Model):
     def get_absolute_url(self):
         return reverse('category_detail', kwargs={'pk': self.pk})
 
+class Location(models.Model):
+    """A place that holds stock: the shop or a storeroom."""
+    name = models.CharField(max_length=100, unique=True)
+    priority = models.PositiveIntegerField(default=0, help_text="Orders are allocated from the lowest number first")
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        ordering = ['priority', 'name']
+
+    def __str__(self):
+        return self.name
+
 class Product(models.Model):
     name = models.CharField(max_length=200)
     category = models.ForeignKey(Category, on_delete=models.PROTECT, related_name='products') # Prevent deleting category if products exist
     description = models.TextField(blank=True, null=True)
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
+    # Total over all locations, maintained by inventory.stock alongside LocationStock
     stock_quantity = models.IntegerField(default=0, validators=[MinValueValidator(0)])
+    # Denormalized sales counters, maintained by inventory.counters (excludes cancelled orders)
+    units_sold = models.IntegerField(default=0, db_index=True, editable=False)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0.00, editable=False)
     # Add image field later if needed: image = models.ImageField(upload_to='products/', blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -35,14 +55,73 @@ class Product(models.Model):
     def is_in_stock(self):
         return self.stock_quantity > 0
 
+    def price_as_of(self, when):
+        """Returns the price that was in effect at the given datetime."""
+        change = self.price_history.filter(changed_at__lte=when).order_by('-changed_at').first()
+        if change:
+            return change.new_price
+        # No change before `when`: the price then is the old price of the first later change
+        change = self.price_history.filter(changed_at__gt=when).order_by('changed_at').first()
+        return change.old_price if change else self.price
+
+class LocationStock(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='location_stock')
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, related_name='stock')
+    quantity = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ('product', 'location')
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} at {self.location}"
+
+class ProductForecast(models.Model):
+    """Demand forecast and reorder suggestion, refreshed by the refresh_forecasts command."""
+    product = models.OneToOneField(Product, on_delete=models.CASCADE, related_name='forecast')
+    computed_at = models.DateTimeField()
+    avg_daily_7 = models.FloatField(help_text="Average units sold per day over the last 7 days")
+    avg_daily_28 = models.FloatField(help_text="Average units sold per day over the last 28 days")
+    smoothed_daily = models.FloatField(help_text="Exponentially smoothed daily demand")
+    weekday_factors = models.JSONField(default=list, help_text="Demand multiplier per weekday, Monday first")
+    forecast_lead_time = models.FloatField(help_text="Expected units sold during the supplier lead time")
+    safety_stock = models.FloatField()
+    reorder_point = models.FloatField()
+    suggested_order_quantity = models.IntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"Forecast for {self.product_id}: order {self.suggested_order_quantity}"
+
+class PriceHistory(models.Model):
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='price_history')
+    old_price = models.DecimalField(max_digits=10, decimal_places=2)
+    new_price = models.DecimalField(max_digits=10, decimal_places=2)
+    changed_at = models.DateTimeField(default=timezone.now)
+    changed_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+
+    class Meta:
+        verbose_name_plural = "Price history"
+        indexes = [
+            models.Index(fields=['product', 'changed_at']), # "price as of date" lookups
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.old_price} -> {self.new_price} on {self.changed_at:%Y-%m-%d}"
+
 class Customer(models.Model):
     name = models.CharField(max_length=200)
     phone_number = models.CharField(max_length=20, blank=True, null=True)
     email = models.EmailField(blank=True, null=True)
     address = models.TextField(help_text="Full address for delivery")
-    # For location: Simple text field for now.
-    # Alternatively, use separate lat/lon DecimalFields or a dedicated GeoDjango field later.
-    location_notes = models.CharField(max_length=255, blank=True, null=True, help_text="Optional: Landmarks, specific instructions, or Lat/Lon")
+    location_notes = models.CharField(max_length=255, blank=True, null=True, help_text="Optional: Landmarks, specific instructions")
+    # Optional coordinates, used by the delivery planner (inventory.routing)
+    latitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    longitude = models.DecimalField(max_digits=9, decimal_places=6, blank=True, null=True)
+    # Normalized phone/email for duplicate lookups, set in save() (see inventory.normalize)
+    phone_key = models.CharField(max_length=20, blank=True, default='', db_index=True, editable=False)
+    email_key = models.CharField(max_length=254, blank=True, default='', db_index=True, editable=False)
+    # Denormalized order totals, maintained by inventory.counters (excludes cancelled orders)
+    balance_due = models.DecimalField(max_digits=14, decimal_places=2, default=0.00, db_index=True, editable=False)
+    lifetime_spend = models.DecimalField(max_digits=14, decimal_places=2, default=0.00, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
 
     def __str__(self):
@@ -51,6 +130,20 @@ class Customer(models.Model):
     def get_absolute_url(self):
         return reverse('customer_detail', kwargs={'pk': self.pk})
 
+    def save(self, *args, **kwargs):
+        self.phone_key = normalize_phone(self.phone_number)
+        self.email_key = normalize_email(self.email)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            # Keep the keys in step when only the contact fields are saved
+            update_fields = set(update_fields)
+            if 'phone_number' in update_fields:
+                update_fields.add('phone_key')
+            if 'email' in update_fields:
+                update_fields.add('email_key')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
 class Order(models.Model):
     ORDER_STATUS_CHOICES = [
         ('PENDING', 'Pending'),
@@ -69,6 +162,13 @@ class Order(models.Model):
     created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='created_orders') # Track who created the order
     notes = models.TextField(blank=True, null=True)
 
+    is_archived = False # See ArchivedOrder
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'order_date']), # Archival and per-day status lookups
+        ]
+
     def __str__(self):
         return f"Order #{self.pk} for {self.customer.name} on {self.order_date.strftime('%Y-%m-%d')}"
 
@@ -107,6 +207,8 @@ class OrderItem(models.Model):
     quantity = models.IntegerField(validators=[MinValueValidator(1)])
     # Store the price at the time of order, as product price might change later
     price_at_order = models.DecimalField(max_digits=10, decimal_places=2)
+    # Where the stock was taken from (set by inventory.stock.allocate); returns go back here
+    location = models.ForeignKey(Location, on_delete=models.PROTECT, null=True, blank=True, related_name='+')
 
     class Meta:
         unique_together = ('order', 'product') # Prevent adding the same product twice to one order
@@ -124,4 +226,126 @@ class OrderItem(models.Model):
         super().save(*args, **kwargs)
         # Optional: Recalculate order total after saving an item
         # self.order.calculate_total()
-        # self.order.save() # Be careful about recursion or multiple saves
\ No newline at end of file
+        # self.order.save() # Be careful about recursion or multiple saves
+
+
+# --- Archive (closed orders moved out of the hot tables by the archive_orders command) ---
+class ArchivedOrder(models.Model):
+    """
+    A closed (Delivered, Paid or Cancelled) order moved out of the Order table.
+    Keeps the original primary key, so order URLs keep working.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='archived_orders')
+    order_date = models.DateTimeField()
+    total_amount = models.DecimalField(max_digits=12, decimal_places=2)
+    amount_paid = models.DecimalField(max_digits=12, decimal_places=2)
+    status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+    created_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    notes = models.TextField(blank=True, null=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    is_archived = True
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['customer', 'order_date']), # Customer order history
+        ]
+
+    def __str__(self):
+        return f"Archived order #{self.pk} for {self.customer.name} on {self.order_date.strftime('%Y-%m-%d')}"
+
+    def get_absolute_url(self):
+        return reverse('order_detail', kwargs={'pk': self.pk})
+
+    def get_amount_due(self):
+        return self.total_amount - self.amount_paid
+
+class ArchivedOrderItem(models.Model):
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='items')
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name='+')
+    quantity = models.IntegerField()
+    price_at_order = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product.name} in archived order #{self.order_id}"
+
+    def get_item_total(self):
+        return self.quantity * self.price_at_order
+
+class OrderArchiveSummary(models.Model):
+    """Monthly per-customer totals of archived orders, kept for reporting."""
+    month = models.DateField(help_text="First day of the month")
+    customer = models.ForeignKey(Customer, on_delete=models.PROTECT, related_name='archive_summaries')
+    status = models.CharField(max_length=20, choices=Order.ORDER_STATUS_CHOICES)
+    order_count = models.IntegerField(default=0)
+    total_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+    amount_paid = models.DecimalField(max_digits=14, decimal_places=2, default=0.00)
+
+    class Meta:
+        verbose_name_plural = "Order archive summaries"
+        unique_together = ('month', 'customer', 'status')
+
+    def __str__(self):
+        return f"{self.customer_id} {self.month:%Y-%m} {self.status}: {self.order_count} orders"
+
+# --- Outbox (side effects of order changes, run later by the process_outbox command) ---
+
+class OutboxEvent(models.Model):
+    """An event written in the same transaction as the change that caused it. See inventory.outbox."""
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('DONE', 'Done'),
+        ('FAILED', 'Failed'),
+    ]
+
+    event_type = models.CharField(max_length=100)
+    # Events with the same key are handled one at a time, in id order. Not a foreign key:
+    # the order may be deleted or archived before its events are processed.
+    order_key = models.BigIntegerField(null=True, blank=True)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='PENDING')
+    attempts = models.PositiveIntegerField(default=0)
+    available_at = models.DateTimeField(default=timezone.now, help_text="Not retried before this time")
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id']), # The worker's queue scan
+        ]
+
+    def __str__(self):
+        return f"{self.event_type} #{self.pk} ({self.status})"
+
+
+# --- Audit log (written by inventory.audit) ---
+
+class AuditLogEntry(models.Model):
+    """One create, update or delete of an audited model, with the changed fields' before/after values."""
+    ACTION_CHOICES = [
+        ('CREATE', 'Created'),
+        ('UPDATE', 'Updated'),
+        ('DELETE', 'Deleted'),
+    ]
+
+    model = models.CharField(max_length=50) # e.g. 'inventory.order'
+    object_id = models.BigIntegerField()
+    # The order an Order or OrderItem entry belongs to, so an order's history is one index range
+    order_key = models.BigIntegerField(null=True, blank=True)
+    action = models.CharField(max_length=10, choices=ACTION_CHOICES)
+    changes = models.JSONField(default=dict, encoder=DjangoJSONEncoder, help_text="{field: [before, after]}")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    timestamp = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        verbose_name_plural = "Audit log entries"
+        indexes = [
+            models.Index(fields=['order_key', 'timestamp']), # History of an order
+            models.Index(fields=['model', 'object_id', 'timestamp']), # History of a product or customer
+            models.Index(fields=['user', 'timestamp']), # Everything a user did on a day
+        ]
+
+    def __str__(self):
+        return f"{self.get_action_display()} {self.model} #{self.object_id} at {self.timestamp:%Y-%m-%d %H:%M}"
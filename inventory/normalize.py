@@ -0,0 +1,25 @@
+"""
+Normalized contact keys for matching customers.
+
+Customer.phone_key and Customer.email_key are derived from the typed phone
+number and email on every save, so "+91 98765-43210", "098765 43210" and
+"9876543210" all match, as do "Asha@Example.com " and "asha@example.com".
+"""
+import re
+
+# Country and trunk prefixes vary in how people type them; the local number doesn't
+PHONE_KEY_DIGITS = 10
+
+
+def normalize_phone(phone):
+    digits = re.sub(r'\D', '', phone or '')
+    return digits[-PHONE_KEY_DIGITS:]
+
+
+def normalize_email(email):
+    return (email or '').strip().lower()
+
+
+def normalize_name(name):
+    """Case- and whitespace-insensitive form of a name, used to confirm a key match."""
+    return ' '.join((name or '').casefold().split())
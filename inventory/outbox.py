@@ -0,0 +1,126 @@
+"""
+Transactional outbox.
+
+Views call publish() inside their transaction.atomic block, so an event row
+exists if and only if the order change committed. Side effects (receipts,
+alerts, cache invalidation, ...) are handlers registered for an event type
+with @handler and are run later by the process_outbox command, which keeps
+checkout latency independent of how many side effects there are.
+
+Delivery is at least once. Each event is handled in its own transaction
+together with marking it done, so database side effects happen exactly
+once; external ones (email) can repeat if the worker dies mid-event.
+Events sharing an order_key are handled one at a time in id order, and a
+failing event holds back the later events of its order until it succeeds
+or is given up on. Run a single process_outbox process: the worker's
+threads split the work between them, but separate processes would not.
+"""
+import logging
+import traceback
+from collections import defaultdict
+from datetime import timedelta
+from importlib import import_module
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Min
+from django.utils import timezone
+
+from .models import OutboxEvent
+
+logger = logging.getLogger(__name__)
+
+HANDLERS = defaultdict(list) # event type -> handler functions, in registration order
+
+
+def handler(event_type):
+    """Decorator registering `func(event)` to run for every event of `event_type`."""
+    def register(func):
+        HANDLERS[event_type].append(func)
+        return func
+    return register
+
+
+def load_handlers():
+    """Imports the modules listed in settings.OUTBOX_HANDLER_MODULES so their handlers register."""
+    for module in getattr(settings, 'OUTBOX_HANDLER_MODULES', ['inventory.events']):
+        import_module(module)
+
+
+def publish(event_type, order=None, payload=None):
+    """Records an event. Call inside the transaction that makes the change."""
+    return OutboxEvent.objects.create(
+        event_type=event_type,
+        order_key=order.pk if order is not None else None,
+        payload=payload or {},
+    )
+
+
+def next_batch(batch_size):
+    """
+    Pending events that are due, grouped by order_key (id order within a group).
+    Events queued behind an earlier event of the same order that is waiting
+    for a retry are left for later.
+    """
+    now = timezone.now()
+    due = list(OutboxEvent.objects.filter(status='PENDING', available_at__lte=now).order_by('id')[:batch_size])
+    keys = {event.order_key for event in due if event.order_key is not None}
+    waiting = dict(
+        OutboxEvent.objects.filter(status='PENDING', available_at__gt=now, order_key__in=keys)
+        .values_list('order_key').annotate(first=Min('id'))
+    )
+    groups = defaultdict(list)
+    for event in due:
+        if event.order_key in waiting and event.id > waiting[event.order_key]:
+            continue
+        # Events without an order are independent of each other
+        groups[event.order_key if event.order_key is not None else f'event-{event.id}'].append(event)
+    return list(groups.values())
+
+
+def _handle_group(events, max_attempts, retry_delay):
+    """Runs one order's events in order, stopping at the first failure. Returns (done, failed)."""
+    done = failed = 0
+    try:
+        for event in events:
+            try:
+                with transaction.atomic():
+                    for func in HANDLERS.get(event.event_type, []):
+                        func(event)
+                    OutboxEvent.objects.filter(pk=event.pk).update(status='DONE', processed_at=timezone.now(), attempts=event.attempts + 1)
+                done += 1
+            except Exception:
+                attempts = event.attempts + 1
+                given_up = attempts >= max_attempts
+                # Exponential backoff, capped at an hour
+                delay = min(retry_delay * 2 ** (attempts - 1), 3600)
+                OutboxEvent.objects.filter(pk=event.pk).update(
+                    status='FAILED' if given_up else 'PENDING', attempts=attempts,
+                    available_at=timezone.now() + timedelta(seconds=delay), last_error=traceback.format_exc(),
+                )
+                logger.exception("Outbox event %s (%s) failed on attempt %s", event.pk, event.event_type, attempts)
+                failed += 1
+                if not given_up:
+                    break # Keep the rest of this order's events behind the one being retried
+    finally:
+        connections.close_all() # This thread's connections; the pool thread may sit idle for a while
+    return done, failed
+
+
+def process_batch(pool, batch_size=100, max_attempts=5, retry_delay=10):
+    """Handles one batch of due events on `pool` (a ThreadPoolExecutor). Returns (done, failed)."""
+    groups = next_batch(batch_size)
+    if not groups:
+        return 0, 0
+    results = list(pool.map(lambda group: _handle_group(group, max_attempts, retry_delay), groups))
+    return sum(done for done, _ in results), sum(failed for _, failed in results)
+
+
+def purge_processed(older_than, batch_size=1000):
+    """Deletes handled events older than `older_than` in batches. Returns the number deleted."""
+    deleted = 0
+    while True:
+        ids = list(OutboxEvent.objects.filter(status='DONE', processed_at__lt=older_than).values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += OutboxEvent.objects.filter(id__in=ids).delete()[0]
@@ -0,0 +1,77 @@
+from django.core.paginator import Paginator
+from django.db import DatabaseError, connections
+from django.utils.functional import cached_property
+
+
+# How far the highest rowid may run ahead of SQLite's analyzed row count
+# before the statistic counts as stale
+SQLITE_STALE_RATIO = 1.1
+
+
+def estimate_row_count(model, using='default'):
+    """
+    Returns a cheap estimate of a model's table size, or None if there is no
+    trustworthy one (the caller then counts exactly).
+
+    PostgreSQL: the planner's estimate, which autovacuum re-analyzes as the
+    table changes (None before the first ANALYZE).
+    SQLite: the row count in sqlite_stat1, which only changes when ANALYZE
+    runs (see analyze_tables). It is only used while the highest rowid is
+    within SQLITE_STALE_RATIO of it: rows added since ANALYZE push the highest
+    rowid up, and rows deleted or archived before it leave gaps. Either way
+    a stale count could hide the newest rows or add empty pages, so the
+    caller counts exactly instead.
+    """
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute("SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass", [table])
+            row = cursor.fetchone()
+            # reltuples is -1 for tables that have never been analyzed
+            return row[0] if row and row[0] >= 0 else None
+        if connection.vendor == 'sqlite':
+            try:
+                # The first number of every sqlite_stat1 row is the table's row count
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+            except DatabaseError: # sqlite_stat1 only exists after the first ANALYZE
+                return None
+            row = cursor.fetchone()
+            if not row:
+                return None
+            analyzed = int(row[0].split()[0])
+            cursor.execute(f"SELECT MAX(rowid) FROM {connection.ops.quote_name(table)}") # One index lookup
+            highest = cursor.fetchone()[0] or 0
+            if highest > analyzed * SQLITE_STALE_RATIO:
+                return None
+            return highest # Never below the real count, and close to it
+    return None
+
+
+def analyze_tables(models, using='default'):
+    """Refreshes the statistics estimate_row_count() reads, e.g. after archiving shrank a table."""
+    connection = connections[using]
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        return
+    with connection.cursor() as cursor:
+        for model in models:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(model._meta.db_table)}")
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that uses the database's row estimate instead of COUNT(*) for
+    unfiltered querysets on large tables. Filtered querysets (search, list
+    filters) still get an exact count, since those are usually small.
+    """
+    # Below this many rows an exact COUNT(*) is cheap enough
+    estimate_threshold = 100_000
+
+    @cached_property
+    def count(self):
+        query = getattr(self.object_list, 'query', None)
+        if query is not None and not query.where:
+            estimate = estimate_row_count(self.object_list.model, using=self.object_list.db)
+            if estimate is not None and estimate > self.estimate_threshold:
+                return estimate
+        return super().count
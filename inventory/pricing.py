@@ -0,0 +1,58 @@
+"""
+Bulk repricing. A price change is applied to any number of products with a
+single UPDATE and recorded in PriceHistory with bulk_create().
+"""
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import DecimalField, F, FloatField, Value
+from django.db.models.functions import Cast, Greatest, Round
+from django.utils import timezone
+
+from .models import Product, PriceHistory
+
+MIN_PRICE = Decimal('0.01') # Same floor as the Product.price validator
+
+
+def record_price_change(product, old_price, user=None):
+    """Records a single-product price edit (forms, admin list_editable)."""
+    if old_price is not None and old_price != product.price:
+        PriceHistory.objects.create(product=product, old_price=old_price, new_price=product.price, changed_by=user)
+
+
+@transaction.atomic
+def reprice_products(queryset, percent=None, amount=None, user=None):
+    """
+    Changes the price of every product in `queryset` by `percent` (e.g. 5 for
+    +5%, -10 for -10%) or by a fixed `amount`, rounded to cents and never
+    below MIN_PRICE. Returns the number of products whose price changed.
+    """
+    if (percent is None) == (amount is None):
+        raise ValueError("Pass exactly one of percent or amount.")
+
+    price_field = DecimalField(max_digits=10, decimal_places=2)
+    if percent is not None:
+        # SQLite keeps whole-number prices as integers, and decimal parameters are
+        # bound as strings, so price * 110 / 100 would be integer division there.
+        # Multiply as a float by one factor; Round() brings it back to cents.
+        factor = float((Decimal(100) + Decimal(percent)) / Decimal(100))
+        new_price = Cast('price', FloatField()) * Value(factor, output_field=FloatField())
+    else:
+        new_price = F('price') + Value(Decimal(amount), output_field=price_field)
+    new_price = Greatest(Round(new_price, 2, output_field=price_field), Value(MIN_PRICE, output_field=price_field))
+
+    if connection.features.has_select_for_update:
+        # Lock the rows so the history rows match what the UPDATE does
+        list(queryset.select_for_update().values_list('pk', flat=True))
+    products = Product.objects.filter(pk__in=queryset.values('pk'))
+
+    # The new prices are computed by the database, so history and UPDATE round the same way
+    changes = products.annotate(new_price=new_price).exclude(new_price=F('price')).values_list('pk', 'price', 'new_price')
+    changed_at = timezone.now()
+    changed = len(PriceHistory.objects.bulk_create([
+        PriceHistory(product_id=pk, old_price=old, new_price=new, changed_at=changed_at, changed_by=user)
+        for pk, old, new in changes.iterator(chunk_size=2000)
+    ], batch_size=1000))
+
+    products.update(price=new_price)
+    return changed
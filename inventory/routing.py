@@ -0,0 +1,187 @@
+"""
+In-process delivery route planning, no external mapping service needed.
+
+Stops are (latitude, longitude) pairs. Planning happens in three steps:
+
+1. Cluster: stops are bucketed into a square grid and whole cells are
+   handed out to drivers in a sweep around the depot, so every driver gets
+   a compact area of roughly the same number of stops.
+2. Construct: each driver's route is built greedily by always driving to
+   the nearest unvisited stop, found through the grid instead of a scan.
+3. Improve: 2-opt removes crossing legs, only trying moves towards each
+   stop's nearest neighbours so large routes stay fast.
+
+Distances use the equirectangular approximation, which is accurate to well
+under 1% at city scale and far cheaper than haversine.
+"""
+import math
+from collections import defaultdict
+
+EARTH_RADIUS_KM = 6371.0
+
+
+def _project(points, origin):
+    """Projects (lat, lon) pairs onto a flat km plane centred on `origin`."""
+    lat0, lon0 = origin
+    kx = math.radians(1) * EARTH_RADIUS_KM * math.cos(math.radians(lat0))
+    ky = math.radians(1) * EARTH_RADIUS_KM
+    return [((lon - lon0) * kx, (lat - lat0) * ky) for lat, lon in points]
+
+
+def _dist(a, b):
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+class GridIndex:
+    """Buckets projected points into square cells for fast neighbour searches."""
+
+    def __init__(self, xy, cell_km):
+        self.xy = xy
+        self.cell_km = cell_km
+        self.cells = defaultdict(set)
+        for i, point in enumerate(xy):
+            self.cells[self.cell_of(point)].add(i)
+        # Cells only ever empty out, so the initial bounds stay valid
+        xs = [c[0] for c in self.cells] or [0]
+        ys = [c[1] for c in self.cells] or [0]
+        self.bounds = (min(xs), max(xs), min(ys), max(ys))
+
+    def cell_of(self, point):
+        return (math.floor(point[0] / self.cell_km), math.floor(point[1] / self.cell_km))
+
+    def remove(self, i):
+        cell = self.cell_of(self.xy[i])
+        self.cells[cell].discard(i)
+        if not self.cells[cell]:
+            del self.cells[cell]
+
+    def _ring(self, cell, radius):
+        cx, cy = cell
+        if radius == 0:
+            yield cell
+            return
+        for dx in range(-radius, radius + 1):
+            yield (cx + dx, cy - radius)
+            yield (cx + dx, cy + radius)
+        for dy in range(-radius + 1, radius):
+            yield (cx - radius, cy + dy)
+            yield (cx + radius, cy + dy)
+
+    def nearest(self, point, k=1, exclude=None):
+        """Returns up to k indexes closest to `point`, nearest first."""
+        if not self.cells:
+            return []
+        cell = self.cell_of(point)
+        min_x, max_x, min_y, max_y = self.bounds
+        max_radius = max(abs(cell[0] - min_x), abs(cell[0] - max_x), abs(cell[1] - min_y), abs(cell[1] - max_y))
+        found = []
+        for radius in range(max_radius + 1):
+            for ring_cell in self._ring(cell, radius):
+                for i in self.cells.get(ring_cell, ()):
+                    if i != exclude:
+                        found.append((_dist(point, self.xy[i]), i))
+            # Anything in further rings is at least `radius` cells away
+            if len(found) >= k:
+                found.sort()
+                if found[k - 1][0] <= radius * self.cell_km:
+                    break
+        found.sort()
+        return [i for _, i in found[:k]]
+
+
+def _cell_size(xy, per_cell=4):
+    """Picks a cell size that puts a handful of points in each occupied cell."""
+    xs = [p[0] for p in xy]
+    ys = [p[1] for p in xy]
+    area = max(max(xs) - min(xs), 0.1) * max(max(ys) - min(ys), 0.1)
+    return max(math.sqrt(area * per_cell / len(xy)), 0.05)
+
+
+def cluster(xy, depot, drivers):
+    """Splits point indexes into `drivers` spatially compact groups."""
+    grid = GridIndex(xy, _cell_size(xy))
+
+    def sweep_key(cell):
+        centre = ((cell[0] + 0.5) * grid.cell_km, (cell[1] + 0.5) * grid.cell_km)
+        return (math.atan2(centre[1] - depot[1], centre[0] - depot[0]), _dist(centre, depot))
+
+    target = math.ceil(len(xy) / drivers)
+    groups = [[]]
+    for cell in sorted(grid.cells, key=sweep_key):
+        if len(groups[-1]) >= target and len(groups) < drivers:
+            groups.append([])
+        groups[-1].extend(sorted(grid.cells[cell]))
+    return [group for group in groups if group]
+
+
+def nearest_neighbour_tour(xy):
+    """Greedy tour over xy starting at index 0 (the depot)."""
+    grid = GridIndex(xy, _cell_size(xy))
+    grid.remove(0)
+    tour = [0]
+    while grid.cells:
+        nxt = grid.nearest(xy[tour[-1]])[0]
+        grid.remove(nxt)
+        tour.append(nxt)
+    return tour
+
+
+def two_opt(tour, xy, neighbours=8, max_passes=50):
+    """
+    Improves a closed tour in place with 2-opt, keeping tour[0] (the depot)
+    fixed. Only moves that link a stop to one of its nearest neighbours are
+    tried, which keeps each pass close to linear.
+    """
+    n = len(tour)
+    if n < 4:
+        return tour
+    grid = GridIndex(xy, _cell_size(xy))
+    candidates = [grid.nearest(xy[i], k=neighbours, exclude=i) for i in range(len(xy))]
+    pos = [0] * len(xy)
+    for p, node in enumerate(tour):
+        pos[node] = p
+
+    for _ in range(max_passes):
+        improved = False
+        for i in range(n):
+            a, b = tour[i], tour[(i + 1) % n]
+            for c in candidates[a]:
+                j = pos[c]
+                d = tour[(j + 1) % n]
+                if c == b or d == a:
+                    continue
+                delta = _dist(xy[a], xy[c]) + _dist(xy[b], xy[d]) - _dist(xy[a], xy[b]) - _dist(xy[c], xy[d])
+                if delta < -1e-9:
+                    lo, hi = min(i, j), max(i, j)
+                    tour[lo + 1:hi + 1] = reversed(tour[lo + 1:hi + 1])
+                    for p in range(lo + 1, hi + 1):
+                        pos[tour[p]] = p
+                    a, b = tour[i], tour[(i + 1) % n]
+                    improved = True
+        if not improved:
+            break
+    return tour
+
+
+def tour_length(tour, xy):
+    return sum(_dist(xy[tour[p]], xy[tour[(p + 1) % len(tour)]]) for p in range(len(tour)))
+
+
+def plan_routes(stops, depot, drivers=1):
+    """
+    Plans closed delivery routes from `depot`, both given as (lat, lon).
+
+    Returns one (stop_indexes, distance_km) pair per driver, where
+    stop_indexes are positions in `stops` in visiting order.
+    """
+    if not stops:
+        return []
+    xy = _project(stops, depot)
+    origin = (0.0, 0.0) # The depot is the projection's centre
+    routes = []
+    for group in cluster(xy, origin, max(1, drivers)):
+        # Index 0 is the depot in the per-route point list
+        route_xy = [origin] + [xy[i] for i in group]
+        tour = two_opt(nearest_neighbour_tour(route_xy), route_xy)
+        routes.append(([group[p - 1] for p in tour[1:]], tour_length(tour, route_xy)))
+    return routes
@@ -0,0 +1,180 @@
+"""
+Per-location stock.
+
+LocationStock holds the quantity of a product at each Location, and
+Product.stock_quantity is kept equal to the total as a maintained summary,
+so availability checks and lists never need a SUM. All changes go through
+adjust_stock() or take_from(), which update both rows with F() expressions.
+A location's quantity never goes below zero through an order: lines that no
+single location can fill are rejected with InsufficientStock.
+
+update() sends no signals, so every change made here is logged to the audit
+log explicitly (before and after quantity, per location and in total).
+"""
+from collections import defaultdict
+
+from django.db.models import F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from . import audit
+from .models import Location, LocationStock, Product
+
+
+def default_location():
+    """The location that receives manual stock edits and returns without a recorded source."""
+    location = Location.objects.filter(is_active=True).first() # Ordered by priority
+    if location is None:
+        location, _ = Location.objects.get_or_create(name='Shop')
+    return location
+
+
+def _log_stock_change(product_id, location_id, delta, location=True, total=True):
+    """
+    Audit entries for a stock change made with update(). The rows are read
+    back in the same transaction, which holds their write locks, so the
+    quantity before the change is the current one minus `delta`.
+    """
+    row = (LocationStock.objects.filter(product_id=product_id, location_id=location_id)
+           .values_list('pk', 'quantity', 'product__stock_quantity').first())
+    if row is None:
+        return
+    pk, quantity, stock_total = row
+    if location:
+        audit.log_update(LocationStock, pk, {'quantity': [quantity - delta, quantity]})
+    if total:
+        audit.log_update(Product, product_id, {'stock_quantity': [stock_total - delta, stock_total]})
+
+
+def adjust_stock(product_id, location_id, delta):
+    """Adds `delta` (negative to take stock) at one location and to the product total."""
+    if not delta:
+        return
+    updated = LocationStock.objects.filter(product_id=product_id, location_id=location_id).update(quantity=F('quantity') + delta)
+    if not updated: # Logged as a CREATE by the audit signals
+        LocationStock.objects.create(product_id=product_id, location_id=location_id, quantity=delta)
+    Product.objects.filter(pk=product_id).update(stock_quantity=F('stock_quantity') + delta)
+    _log_stock_change(product_id, location_id, delta, location=bool(updated))
+
+
+class InsufficientStock(Exception):
+    """No single active location holds enough for an order line (lines are never split)."""
+
+    def __init__(self, item, available):
+        self.item = item
+        self.available = available # [(location name, quantity), ...] holding some of the product, or None
+        total = sum(quantity for _, quantity in available or ())
+        if available is None:
+            message = f"Not enough stock for {item.product.name}: it was just taken by another order."
+        elif total >= item.quantity:
+            where = ', '.join(f"{name} {quantity}" for name, quantity in available)
+            message = (f"Not enough stock for {item.product.name} at any one location ({where}). "
+                       f"Move stock between locations or split the quantity over several orders.")
+        else:
+            message = f"Not enough stock for {item.product.name}. Available: {total}"
+        super().__init__(message)
+
+
+def allocate(items):
+    """
+    Chooses a location for each unsaved OrderItem and sets item.location_id.
+
+    Stock for all the order's products is read in one query. If one location
+    can fulfil every line, the whole order ships from it (best priority
+    first); otherwise each line goes to the best location that can fulfil it.
+    Raises InsufficientStock for a line no location can fulfil on its own.
+    """
+    needed = defaultdict(int)
+    for item in items:
+        needed[item.product_id] += item.quantity
+
+    stock = {}
+    priorities = {}
+    names = {}
+    rows = (LocationStock.objects.filter(product_id__in=needed, location__is_active=True)
+            .values_list('location_id', 'product_id', 'quantity', 'location__priority', 'location__name'))
+    for location_id, product_id, quantity, priority, name in rows:
+        stock[location_id, product_id] = quantity
+        priorities[location_id] = (priority, location_id)
+        names[location_id] = name
+
+    by_priority = sorted(priorities, key=priorities.get)
+    complete = [loc for loc in by_priority if all(stock.get((loc, p), 0) >= q for p, q in needed.items())]
+    for item in items:
+        if complete:
+            item.location_id = complete[0]
+            continue
+        enough = [loc for loc in by_priority if stock.get((loc, item.product_id), 0) >= item.quantity]
+        if not enough:
+            raise InsufficientStock(item, [
+                (names[loc], stock[loc, item.product_id]) for loc in by_priority
+                if stock.get((loc, item.product_id), 0) > 0
+            ])
+        item.location_id = enough[0]
+    return items
+
+
+def take_from(product_id, location_id, quantity):
+    """
+    Removes `quantity` at one location if it holds that much. The check and
+    the update are one statement, so concurrent orders can't both take the
+    last units. Returns whether the stock was taken.
+    """
+    if not LocationStock.objects.filter(product_id=product_id, location_id=location_id,
+                                        quantity__gte=quantity).update(quantity=F('quantity') - quantity):
+        return False
+    Product.objects.filter(pk=product_id).update(stock_quantity=F('stock_quantity') - quantity)
+    _log_stock_change(product_id, location_id, -quantity)
+    return True
+
+
+def take_stock(items):
+    """
+    Allocates the given unsaved OrderItems and removes their quantities from
+    stock. Raises InsufficientStock (after taking stock for earlier lines, so
+    callers roll back) if a line can't be filled from one location.
+    """
+    for item in allocate(items):
+        if not take_from(item.product_id, item.location_id, item.quantity):
+            # Taken by a concurrent order since allocate() read the stock
+            raise InsufficientStock(item, None)
+
+
+def return_stock(item, quantity=None):
+    """Puts an OrderItem's quantity (or part of it) back where it was taken from."""
+    location_id = item.location_id or default_location().pk
+    adjust_stock(item.product_id, location_id, item.quantity if quantity is None else quantity)
+
+
+def record_stock_edit(product, old_total):
+    """
+    Applies a manual edit of Product.stock_quantity (product forms, admin
+    list_editable) to the default location, as the change the user made from
+    the value they saw, and then recomputes the total from the locations. The
+    product row is already saved; orders that took stock since the form was
+    loaded are kept, so the total and the locations always agree. The default
+    location never goes below zero.
+    """
+    delta = product.stock_quantity - (old_total or 0)
+    if not delta:
+        return
+    location = default_location()
+    stock = LocationStock.objects.select_for_update().filter(product=product, location=location).first()
+    if stock is None: # Logged as a CREATE by the audit signals
+        LocationStock.objects.create(product=product, location=location, quantity=max(delta, 0))
+    else:
+        quantity = max(stock.quantity + delta, 0)
+        LocationStock.objects.filter(pk=stock.pk).update(quantity=quantity)
+        audit.log_update(LocationStock, stock.pk, {'quantity': [stock.quantity, quantity]})
+    sync_product_totals([product.pk])
+
+
+def sync_product_totals(product_ids=None):
+    """Recomputes Product.stock_quantity from LocationStock, for all or some products."""
+    totals = (LocationStock.objects.filter(product=OuterRef('pk')).values('product')
+              .annotate(total=Sum('quantity')).values('total'))
+    products = Product.objects.all() if product_ids is None else Product.objects.filter(pk__in=product_ids)
+    before = dict(products.values_list('pk', 'stock_quantity'))
+    products.update(stock_quantity=Coalesce(Subquery(totals), Value(0), output_field=IntegerField()))
+    for pk, stock_total in products.values_list('pk', 'stock_quantity'):
+        if pk in before and before[pk] != stock_total:
+            audit.log_update(Product, pk, {'stock_quantity': [before[pk], stock_total]})
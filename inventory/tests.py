@@ -0,0 +1,586 @@
+import gzip
+import hashlib
+import os
+import random
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, router, transaction
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from stationary_store import replica
+
+from . import audit, backup, outbox
+from .auth import CachedModelBackend
+from .counters import form_update_fields
+from .dedup import find_duplicate_clusters, matching_customers, merge_clusters
+from .forecasting import build_forecasts, daily_sales_matrix, refresh_forecasts
+from .forms import ProductForm, RepriceForm
+from .models import (
+    ArchivedOrder, ArchivedOrderItem, AuditLogEntry, Category, Customer, Location, LocationStock, Order, OrderArchiveSummary,
+    OrderItem, OutboxEvent, PriceHistory, Product, ProductForecast,
+)
+from .paginator import analyze_tables, estimate_row_count
+from .pricing import reprice_products
+from .routing import nearest_neighbour_tour, plan_routes, tour_length, two_opt
+from .stock import InsufficientStock, record_stock_edit, take_from, take_stock
+
+
+class RepriceProductsTests(TestCase):
+    """SQLite stores whole-number prices as integers; repricing must not fall into integer division."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Pens")
+        self.prices = {
+            Product.objects.create(name=name, category=category, price=Decimal(price)).pk: Decimal(price)
+            for name, price in [("A", '5.00'), ("B", '12.00'), ("C", '1.00'), ("D", '2.50')]
+        }
+
+    def assertRepriced(self, expected, changed):
+        for pk, price in expected.items():
+            self.assertEqual(Product.objects.get(pk=pk).price, price)
+        history = {
+            row.product_id: (row.old_price, row.new_price)
+            for row in PriceHistory.objects.all()
+        }
+        self.assertEqual(history, {
+            pk: (self.prices[pk], price) for pk, price in expected.items() if price != self.prices[pk]
+        })
+        self.assertEqual(changed, len(history))
+
+    def test_percentage_rise(self):
+        changed = reprice_products(Product.objects.all(), percent=10)
+        expected = dict(zip(self.prices, map(Decimal, ['5.50', '13.20', '1.10', '2.75'])))
+        self.assertRepriced(expected, changed)
+
+    def test_percentage_cut(self):
+        changed = reprice_products(Product.objects.all(), percent=-10)
+        expected = dict(zip(self.prices, map(Decimal, ['4.50', '10.80', '0.90', '2.25'])))
+        self.assertRepriced(expected, changed)
+
+    def test_cut_never_goes_below_minimum(self):
+        changed = reprice_products(Product.objects.all(), percent=-100)
+        self.assertRepriced({pk: Decimal('0.01') for pk in self.prices}, changed)
+
+    def test_fixed_amount(self):
+        changed = reprice_products(Product.objects.all(), amount=Decimal('0.50'))
+        expected = dict(zip(self.prices, map(Decimal, ['5.50', '12.50', '1.50', '3.00'])))
+        self.assertRepriced(expected, changed)
+
+
+class RepriceFormTests(TestCase):
+    """The product picker renders only the chosen products, never the whole catalogue."""
+
+    def test_only_chosen_products_are_rendered(self):
+        category = Category.objects.create(name="Pens")
+        pen, _ = (Product.objects.create(name=name, category=category, price=Decimal('1.00')) for name in ("Pen", "Pencil"))
+        self.assertNotIn("<option", str(RepriceForm()['products']))
+
+        form = RepriceForm({'products': [pen.pk], 'change_type': 'percent', 'value': '5'})
+        self.assertTrue(form.is_valid())
+        self.assertEqual(list(form.get_queryset()), [pen])
+        rendered = str(form['products'])
+        self.assertIn("Pen", rendered)
+        self.assertNotIn("Pencil", rendered)
+
+
+class TakeStockTests(TestCase):
+    """Order lines come from one location each and never drive a location below zero."""
+
+    def setUp(self):
+        self.shop, _ = Location.objects.update_or_create(name="Shop", defaults={"priority": 0}) # Created by a migration
+        self.storeroom = Location.objects.create(name="Storeroom", priority=1)
+        self.product = Product.objects.create(
+            name="Pen", category=Category.objects.create(name="Pens"), price=Decimal('1.00'), stock_quantity=8,
+        )
+        LocationStock.objects.create(product=self.product, location=self.shop, quantity=3)
+        LocationStock.objects.create(product=self.product, location=self.storeroom, quantity=5)
+
+    def stock(self):
+        return dict(LocationStock.objects.filter(product=self.product).values_list('location__name', 'quantity'))
+
+    def test_line_goes_to_a_location_that_can_fill_it(self):
+        item = OrderItem(product=self.product, quantity=4)
+        take_stock([item])
+        self.assertEqual(item.location_id, self.storeroom.pk)
+        self.assertEqual(self.stock(), {"Shop": 3, "Storeroom": 1})
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 4)
+
+    def test_manual_edit_keeps_stock_taken_since_the_form_loaded(self):
+        take_from(self.product.pk, self.shop.pk, 2) # An order, after the edit form showed 8
+        self.product.stock_quantity = 9 # The user adds one
+        self.product.save()
+        record_stock_edit(self.product, 8)
+        self.assertEqual(self.stock(), {"Shop": 2, "Storeroom": 5})
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 7)
+
+    def test_manual_edit_never_takes_a_location_below_zero(self):
+        take_from(self.product.pk, self.shop.pk, 3)
+        self.product.stock_quantity = 4 # The user removes four of the shop's three (already sold) units
+        self.product.save()
+        record_stock_edit(self.product, 8)
+        self.assertEqual(self.stock(), {"Shop": 0, "Storeroom": 5})
+        self.assertEqual(Product.objects.get(pk=self.product.pk).stock_quantity, 5)
+
+    def test_line_no_single_location_can_fill_is_rejected(self):
+        with self.assertRaisesMessage(InsufficientStock, "at any one location (Shop 3, Storeroom 5)"):
+            take_stock([OrderItem(product=self.product, quantity=7)])
+        self.assertEqual(self.stock(), {"Shop": 3, "Storeroom": 5})
+
+
+class FormUpdateFieldsTests(TestCase):
+    """Edits write only the changed fields, so counters updated meanwhile with F() survive."""
+
+    def test_edit_keeps_counters_updated_since_the_form_was_loaded(self):
+        product = Product.objects.create(
+            name="Pen", category=Category.objects.create(name="Pens"), price=Decimal('1.00'), stock_quantity=5,
+        )
+        # An order commits after the edit form read the product
+        Product.objects.filter(pk=product.pk).update(units_sold=F('units_sold') + 2, revenue=F('revenue') + 2,
+                                                     stock_quantity=F('stock_quantity') - 2)
+        form = ProductForm({'name': "Blue pen", 'category': product.category_id, 'price': '1.00', 'stock_quantity': 5},
+                           instance=product)
+        self.assertTrue(form.is_valid())
+        self.assertEqual(sorted(form_update_fields(form)), ['name', 'updated_at'])
+        form.save(commit=False).save(update_fields=form_update_fields(form))
+
+        product.refresh_from_db()
+        self.assertEqual((product.name, product.units_sold, product.revenue, product.stock_quantity),
+                         ("Blue pen", 2, Decimal('2.00'), 3))
+
+
+class MatchingCustomersTests(TestCase):
+    """Suggestions while typing a phone number, with or without country and trunk prefixes."""
+
+    def setUp(self):
+        self.customer = Customer.objects.create(name="Asha", phone_number="98765 43210", address="-")
+        Customer.objects.create(name="Other", phone_number="91234 56789", address="-")
+
+    def assertSuggests(self, phone):
+        self.assertEqual(list(matching_customers(phone)), [self.customer], phone)
+
+    def test_partial_numbers(self):
+        for phone in ["98765", "098765", "+91 98765", "+91-9876", "0091 98765", "+1 98765"]:
+            self.assertSuggests(phone)
+
+    def test_complete_numbers(self):
+        for phone in ["9876543210", "+91 98765 43210", "0091 98765-43210", "098765 43210"]:
+            self.assertSuggests(phone)
+
+
+class AuditLogTests(TestCase):
+    """Committed changes are logged once per object and request; rolled-back ones never."""
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user('clerk')
+        self.category = Category.objects.create(name="Pens")
+
+    def entries(self):
+        return list(AuditLogEntry.objects.order_by('pk').values_list('model', 'action', 'changes', 'user_id'))
+
+    def test_saves_of_one_object_are_coalesced(self):
+        with audit.audit_context(self.user), self.captureOnCommitCallbacks(execute=True):
+            product = Product.objects.create(name="Pen", category=self.category, price=Decimal('1.00'))
+            product.price = Decimal('1.50')
+            product.save()
+            product.name = "Blue pen"
+            product.save()
+        [(model, action, changes, user_id)] = self.entries()
+        self.assertEqual((model, action, user_id), ('inventory.product', 'CREATE', self.user.pk))
+        self.assertEqual(changes['name'], [None, "Blue pen"])
+        self.assertEqual(changes['price'], [None, '1.50'])
+
+    def test_update_then_revert_logs_nothing(self):
+        product = Product.objects.create(name="Pen", category=self.category, price=Decimal('1.00'))
+        product = Product.objects.get(pk=product.pk)
+        with audit.audit_context(self.user), self.captureOnCommitCallbacks(execute=True):
+            product.name = "Blue pen"
+            product.save()
+            product.name = "Pen"
+            product.save()
+        self.assertEqual(self.entries(), [])
+
+    def test_savepoint_rollback_drops_entries(self):
+        product = Product.objects.create(name="Pen", category=self.category, price=Decimal('1.00'))
+        product = Product.objects.get(pk=product.pk)
+        with audit.audit_context(self.user), self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    product.name = "Blue pen"
+                    product.save()
+                    raise ValueError
+            except ValueError:
+                pass
+            Customer.objects.create(name="Asha", address="-")
+        self.assertEqual([(model, action) for model, action, _, _ in self.entries()], [('inventory.customer', 'CREATE')])
+
+    def test_suppressed_deletes_are_not_logged(self):
+        customer = Customer.objects.create(name="Asha", address="-")
+        with self.captureOnCommitCallbacks(execute=True), audit.suppressed():
+            customer.delete()
+        self.assertEqual(self.entries(), [])
+
+    def test_stock_updates_are_logged_with_before_and_after(self):
+        product = Product.objects.create(name="Pen", category=self.category, price=Decimal('1.00'), stock_quantity=5)
+        location = Location.objects.first()
+        LocationStock.objects.create(product=product, location=location, quantity=5)
+        with audit.audit_context(self.user), self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(take_from(product.pk, location.pk, 2))
+        self.assertEqual([(model, changes) for model, _, changes, _ in self.entries()], [
+            ('inventory.locationstock', {'quantity': [5, 3]}),
+            ('inventory.product', {'stock_quantity': [5, 3]}),
+        ])
+
+
+class EstimateRowCountTests(TestCase):
+    """A stale SQLite statistic is never used, so paging can't hide rows or add empty pages."""
+
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest("Checks the SQLite estimate")
+        self.category = Category.objects.create(name="Pens")
+
+    def add_products(self, count):
+        Product.objects.bulk_create([Product(name=f"P{i}", category=self.category, price=1) for i in range(count)])
+
+    def test_estimate_follows_analyze(self):
+        self.add_products(20)
+        analyze_tables([Product])
+        self.assertEqual(estimate_row_count(Product), 20)
+
+        self.add_products(10) # Grown past the statistic
+        self.assertIsNone(estimate_row_count(Product))
+        analyze_tables([Product])
+        self.assertEqual(estimate_row_count(Product), 30)
+
+        Product.objects.filter(pk__lte=Product.objects.order_by('pk')[19].pk).delete() # Archived, say
+        analyze_tables([Product])
+        self.assertIsNone(estimate_row_count(Product)) # 10 rows left, highest rowid still 30
+
+
+class MergeClustersTests(TestCase):
+    """Merging moves orders and counters to the oldest customer without overwriting concurrent increments."""
+
+    def test_counters_are_added_to_the_survivor(self):
+        survivor = Customer.objects.create(name="Asha", phone_number="98765 43210", address="-")
+        duplicate = Customer.objects.create(name="asha", phone_number="+91 98765 43210", email="asha@example.com", address="-")
+        Customer.objects.filter(pk=survivor.pk).update(balance_due=Decimal('10.00'), lifetime_spend=Decimal('20.00'))
+        Customer.objects.filter(pk=duplicate.pk).update(balance_due=Decimal('1.50'), lifetime_spend=Decimal('2.50'))
+        order = Order.objects.create(customer=duplicate, total_amount=Decimal('2.50'))
+
+        clusters = find_duplicate_clusters()
+        self.assertEqual(clusters, [[survivor.pk, duplicate.pk]])
+        self.assertEqual(merge_clusters(clusters), 1)
+
+        survivor.refresh_from_db()
+        self.assertEqual((survivor.balance_due, survivor.lifetime_spend), (Decimal('11.50'), Decimal('22.50')))
+        self.assertEqual(survivor.email, "asha@example.com")
+        self.assertEqual(Order.objects.get(pk=order.pk).customer_id, survivor.pk)
+        self.assertFalse(Customer.objects.filter(pk=duplicate.pk).exists())
+
+
+class InlinePool:
+    """Stands in for the worker's ThreadPoolExecutor, so handlers run inside the test transaction."""
+    map = staticmethod(map)
+
+
+class OutboxTests(TestCase):
+    """Events of one order are handled in order, and a failed one holds back the rest until it is retried."""
+
+    def setUp(self):
+        self.handled = []
+        self.failures = 1
+        for event_type in ('test.first', 'test.second'):
+            outbox.handler(event_type)(self.record)
+        self.addCleanup(lambda: [outbox.HANDLERS.pop(event_type) for event_type in ('test.first', 'test.second')])
+        self.order = Order.objects.create(customer=Customer.objects.create(name="Asha", address="-"))
+
+    def record(self, event):
+        if event.event_type == 'test.first' and self.failures:
+            self.failures -= 1
+            raise RuntimeError("Mail server down")
+        self.handled.append((event.event_type, event.order_key))
+
+    def status(self):
+        return list(OutboxEvent.objects.order_by('id').values_list('event_type', 'status', 'attempts'))
+
+    def test_failed_event_holds_back_its_order_until_retried(self):
+        outbox.publish('test.first', self.order)
+        outbox.publish('test.second', self.order)
+        outbox.publish('test.second') # No order: independent of the failure
+
+        with self.assertLogs('inventory.outbox', 'ERROR'):
+            self.assertEqual(outbox.process_batch(InlinePool()), (1, 1))
+        self.assertEqual(self.handled, [('test.second', None)])
+        self.assertEqual(self.status(), [('test.first', 'PENDING', 1), ('test.second', 'PENDING', 0), ('test.second', 'DONE', 1)])
+        self.assertEqual(outbox.process_batch(InlinePool()), (0, 0)) # Backing off
+
+        OutboxEvent.objects.filter(status='PENDING').update(available_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(outbox.process_batch(InlinePool()), (2, 0))
+        self.assertEqual(self.handled[1:], [('test.first', self.order.pk), ('test.second', self.order.pk)])
+
+    def test_event_is_given_up_after_max_attempts(self):
+        self.failures = 2
+        outbox.publish('test.first', self.order)
+        with self.assertLogs('inventory.outbox', 'ERROR'):
+            outbox.process_batch(InlinePool(), max_attempts=2)
+            OutboxEvent.objects.update(available_at=timezone.now() - timedelta(seconds=1))
+            self.assertEqual(outbox.process_batch(InlinePool(), max_attempts=2), (0, 1))
+        self.assertEqual(self.status(), [('test.first', 'FAILED', 2)])
+        self.assertIn("Mail server down", OutboxEvent.objects.get().last_error)
+
+    def test_admin_edit_publishes_removed_lines(self):
+        user = get_user_model().objects.create_superuser('admin', password='-')
+        self.client.force_login(user)
+        category = Category.objects.create(name="Pens")
+        pen, pencil = (Product.objects.create(name=name, category=category, price=Decimal('1.00')) for name in ("Pen", "Pencil"))
+        item = OrderItem.objects.create(order=self.order, product=pen, quantity=1)
+        response = self.client.post(reverse('admin:inventory_order_change', args=[self.order.pk]), {
+            'customer': self.order.customer_id, 'amount_paid': '0', 'status': 'PENDING', 'notes': '',
+            'items-TOTAL_FORMS': '2', 'items-INITIAL_FORMS': '1', 'items-MIN_NUM_FORMS': '0', 'items-MAX_NUM_FORMS': '1000',
+            'items-0-id': item.pk, 'items-0-order': self.order.pk, 'items-0-product': pen.pk, 'items-0-quantity': '1',
+            'items-0-DELETE': 'on',
+            'items-1-order': self.order.pk, 'items-1-product': pencil.pk, 'items-1-quantity': '2',
+        })
+        self.assertEqual(response.status_code, 302)
+        event = OutboxEvent.objects.get(event_type='order.updated')
+        self.assertEqual(event.payload['products'], sorted([pen.pk, pencil.pk]))
+
+
+class BackupTests(TestCase):
+    """Backups restore what was there, and pruning never removes chunks a backup still needs."""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(BACKUP_DIR=directory.name))
+
+    def test_logical_dump_restores_the_data(self):
+        pk = Category.objects.create(name="Pens").pk
+        manifest, _ = backup.dump_logical()
+        self.assertEqual(manifest['rows']['inventory.category'], 1)
+
+        Category.objects.all().delete()
+        Category.objects.create(name="Paper")
+        backup.restore_logical(backup.load_manifest(manifest['name']))
+        self.assertEqual(list(Category.objects.values_list('pk', 'name')), [(pk, "Pens")])
+
+    def add_chunk(self, data, age=0):
+        digest = hashlib.sha256(data).hexdigest()
+        path = backup._chunk_path(digest)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with gzip.open(path, 'wb') as out:
+            out.write(data)
+        os.utime(path, (time.time() - age, time.time() - age))
+        return digest
+
+    def add_manifest(self, name, chunks, age):
+        path = backup._write_manifest({'name': name, 'format': 'sqlite-chunks', 'chunks': chunks})
+        os.utime(path, (time.time() - age, time.time() - age))
+
+    def test_prune_keeps_chunks_in_use_or_recently_written(self):
+        day = 24 * 3600
+        kept = self.add_chunk(b"kept", age=10 * day)
+        old = self.add_chunk(b"old", age=10 * day)
+        running = self.add_chunk(b"running") # Written by a backup whose manifest doesn't exist yet
+        self.add_manifest("new", [kept], age=day)
+        self.add_manifest("older", [kept, old], age=2 * day)
+
+        self.assertEqual(backup.prune(1), (1, 1))
+        self.assertEqual(sorted(path.stem for path in backup.backup_dir().glob('*.json')), ["new"])
+        self.assertTrue(backup._chunk_path(kept).exists())
+        self.assertFalse(backup._chunk_path(old).exists())
+        self.assertTrue(backup._chunk_path(running).exists())
+
+
+class ArchiveOrdersTests(TestCase):
+    """Archiving moves closed orders and adds them to the summaries; counters and the audit log stay as they were."""
+
+    def test_closed_orders_are_moved_and_summarised(self):
+        customer = Customer.objects.create(name="Asha", address="-")
+        product = Product.objects.create(name="Pen", category=Category.objects.create(name="Pens"), price=Decimal('1.00'))
+        old = timezone.make_aware(datetime(2024, 1, 15))
+        orders = []
+        for status, total in [('PAID', '3.00'), ('PAID', '2.00'), ('DELIVERED', '5.00'), ('PENDING', '1.00')]:
+            order = Order.objects.create(customer=customer, status=status, total_amount=Decimal(total), amount_paid=Decimal(total))
+            OrderItem.objects.create(order=order, product=product, quantity=1, price_at_order=Decimal(total))
+            orders.append(order)
+        Order.objects.update(order_date=old)
+        OrderArchiveSummary.objects.create(month=date(2024, 1, 1), customer=customer, status='PAID', order_count=1,
+                                           total_amount=Decimal('4.00'), amount_paid=Decimal('4.00'))
+        Customer.objects.filter(pk=customer.pk).update(balance_due=Decimal('7.00'), lifetime_spend=Decimal('11.00'))
+        Product.objects.filter(pk=product.pk).update(units_sold=4, revenue=Decimal('11.00'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('archive_orders', before='2025-01-01', batch_size=2, stdout=StringIO())
+
+        self.assertEqual(list(Order.objects.values_list('pk', flat=True)), [orders[3].pk])
+        self.assertEqual(sorted(ArchivedOrder.objects.values_list('pk', flat=True)), [order.pk for order in orders[:3]])
+        self.assertEqual(ArchivedOrderItem.objects.count(), 3)
+        self.assertEqual(sorted(OrderArchiveSummary.objects.values_list('status', 'order_count', 'total_amount')), [
+            ('DELIVERED', 1, Decimal('5.00')), ('PAID', 3, Decimal('9.00')),
+        ])
+        customer.refresh_from_db()
+        product.refresh_from_db()
+        self.assertEqual((customer.balance_due, customer.lifetime_spend), (Decimal('7.00'), Decimal('11.00')))
+        self.assertEqual((product.units_sold, product.revenue), (4, Decimal('11.00')))
+        self.assertFalse(AuditLogEntry.objects.exists())
+
+
+class CachedModelBackendTests(TestCase):
+    """Logged-in users come from the cache until they, their groups or their permissions change."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.backend = CachedModelBackend()
+        self.user = get_user_model().objects.create_user('clerk')
+
+    def test_user_is_cached(self):
+        self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.backend.get_user(self.user.pk), self.user)
+
+    def test_saving_the_user_or_their_groups_drops_the_cached_copy(self):
+        self.backend.get_user(self.user.pk)
+        self.user.first_name = "Asha"
+        self.user.save()
+        self.assertEqual(self.backend.get_user(self.user.pk).first_name, "Asha")
+
+        Group.objects.create(name="Staff").user_set.add(self.user) # From the group side
+        with self.assertNumQueries(1): # Loaded again
+            self.backend.get_user(self.user.pk)
+
+    def test_deactivated_user_is_refused(self):
+        self.backend.get_user(self.user.pk)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(self.backend.get_user(self.user.pk))
+
+
+class RoutingTests(SimpleTestCase):
+    """2-opt only ever shortens the greedy tour, and every stop is delivered exactly once."""
+
+    def random_points(self, count, seed):
+        rng = random.Random(seed)
+        return [(0.0, 0.0)] + [(rng.uniform(-10, 10), rng.uniform(-10, 10)) for _ in range(count)]
+
+    def test_two_opt_is_never_longer_than_nearest_neighbour(self):
+        for seed, count in enumerate([3, 5, 20, 100, 500]):
+            xy = self.random_points(count, seed)
+            greedy = nearest_neighbour_tour(xy)
+            improved = two_opt(list(greedy), xy)
+            self.assertEqual(sorted(improved), list(range(len(xy))))
+            self.assertEqual(improved[0], 0) # Starts at the depot
+            self.assertLessEqual(tour_length(improved, xy), tour_length(greedy, xy) + 1e-9)
+
+    def test_two_opt_removes_a_crossing(self):
+        xy = [(0, 0), (1, 1), (1, 0), (0, 1)] # 0-1-2-3 crosses itself
+        self.assertAlmostEqual(tour_length(two_opt([0, 1, 2, 3], xy), xy), 4)
+
+    def test_every_stop_is_routed_once(self):
+        rng = random.Random(7)
+        stops = [(12.97 + rng.uniform(-0.1, 0.1), 77.59 + rng.uniform(-0.1, 0.1)) for _ in range(60)]
+        routes = plan_routes(stops, (12.97, 77.59), drivers=3)
+        self.assertEqual(len(routes), 3)
+        self.assertEqual(sorted(i for route, _ in routes for i in route), list(range(60)))
+        self.assertTrue(all(distance > 0 for _, distance in routes))
+
+
+@mock.patch('stationary_store.replica.replica_configured', return_value=True)
+class ReplicaRoutingTests(SimpleTestCase):
+    """Safe requests read from the replica until they write; the browser then stays on the primary for a while."""
+
+    def request(self, view, method='get', cookies=None):
+        request = getattr(RequestFactory(), method)('/')
+        request.COOKIES.update(cookies or {})
+        return replica.ReplicaRoutingMiddleware(view)(request)
+
+    def test_reads_move_to_the_primary_after_a_write(self, configured):
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Product))
+            router.db_for_write(Product)
+            reads.append(router.db_for_read(Product))
+            return HttpResponse()
+
+        response = self.request(view)
+        self.assertEqual(reads, [replica.REPLICA, replica.PRIMARY])
+        self.assertIn(replica.PIN_COOKIE, response.cookies)
+
+    def test_pinned_and_unsafe_requests_read_from_the_primary(self, configured):
+        reads = []
+
+        def view(request):
+            reads.append(router.db_for_read(Product))
+            return HttpResponse()
+
+        response = self.request(view, cookies={replica.PIN_COOKIE: '1'})
+        self.request(view, method='post')
+        self.assertEqual(reads, [replica.PRIMARY, replica.PRIMARY])
+        self.assertNotIn(replica.PIN_COOKIE, response.cookies) # Nothing written: the pin runs out
+
+    def test_code_outside_requests_opts_in(self, configured):
+        self.assertEqual(router.db_for_read(Product), replica.PRIMARY)
+        with replica.use_replica():
+            self.assertEqual(router.db_for_read(Product), replica.REPLICA)
+
+
+class ForecastingTests(TestCase):
+    """Sales are counted per product and day from live and archived orders, and steady sellers get reorder suggestions."""
+
+    def setUp(self):
+        category = Category.objects.create(name="Pens")
+        self.customer = Customer.objects.create(name="Asha", address="-")
+        self.pen = Product.objects.create(name="Pen", category=category, price=Decimal('1.00'), stock_quantity=1)
+        self.paper = Product.objects.create(name="Paper", category=category, price=Decimal('1.00'), stock_quantity=10)
+        self.end = date(2024, 3, 31)
+
+    def sell(self, product, day, quantity, status='PAID'):
+        order = Order.objects.create(customer=self.customer, status=status)
+        OrderItem.objects.create(order=order, product=product, quantity=quantity, price_at_order=product.price)
+        noon = timezone.make_aware(datetime.combine(day, datetime.min.time()) + timedelta(hours=12))
+        Order.objects.filter(pk=order.pk).update(order_date=noon)
+        return order
+
+    def test_daily_sales_matrix(self):
+        self.sell(self.pen, self.end, 2)
+        self.sell(self.pen, self.end, 5, status='CANCELLED')
+        archived = ArchivedOrder.objects.create(
+            id=10_000, customer=self.customer, status='PAID', total_amount=Decimal('3.00'), amount_paid=Decimal('3.00'),
+            order_date=timezone.make_aware(datetime(2024, 3, 29, 12)),
+        )
+        ArchivedOrderItem.objects.create(order=archived, product=self.paper, quantity=3, price_at_order=Decimal('1.00'))
+
+        product_ids, start, matrix = daily_sales_matrix(3, self.end)
+        self.assertEqual(list(product_ids), [self.pen.pk, self.paper.pk])
+        self.assertEqual(start, date(2024, 3, 29))
+        self.assertEqual(matrix.tolist(), [[0, 0, 2], [3, 0, 0]])
+
+    def test_steady_seller_below_reorder_point_gets_a_suggestion(self):
+        for offset in range(28):
+            self.sell(self.pen, self.end - timedelta(days=offset), 2)
+        forecasts = {forecast.product_id: forecast for forecast in build_forecasts(days=28, end=self.end)}
+
+        pen, paper = forecasts[self.pen.pk], forecasts[self.paper.pk]
+        self.assertAlmostEqual(pen.avg_daily_7, 2)
+        self.assertAlmostEqual(pen.forecast_lead_time, 14)
+        self.assertEqual(pen.suggested_order_quantity, 14 + 14 - 1) # Lead time and one review period, less stock
+        self.assertEqual((paper.avg_daily_28, paper.suggested_order_quantity), (0, 0))
+
+        self.assertEqual(refresh_forecasts(days=28, end=self.end), 2)
+        self.assertEqual(refresh_forecasts(days=28, end=self.end), 2) # Upserted, not duplicated
+        self.assertEqual(ProductForecast.objects.count(), 2)
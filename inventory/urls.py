@@ -15,6 +15,8 @@ urlpatterns = [
     # Products
     path('products/', views.ProductListView.as_view(), name='product_list'),
     path('products/new/', views.ProductCreateView.as_view(), name='product_create'),
+    path('products/reprice/', views.product_reprice, name='product_reprice'), # Bulk price change
+    path('products/lookup/', views.product_lookup, name='product_lookup'), # JSON suggestions for repricing
     path('products/<int:pk>/', views.ProductDetailView.as_view(), name='product_detail'),
     path('products/<int:pk>/edit/', views.ProductUpdateView.as_view(), name='product_update'),
     path('products/<int:pk>/delete/', views.ProductDeleteView.as_view(), name='product_delete'),
@@ -23,6 +25,7 @@ urlpatterns = [
     path('customers/', views.CustomerListView.as_view(), name='customer_list'),
     path('customers/new/', views.CustomerCreateView.as_view(), name='customer_create'),
     path('customers/quick-new/', views.quick_customer_create, name='quick_customer_create'), # Quick add view
+    path('customers/lookup/', views.customer_lookup, name='customer_lookup'), # JSON suggestions for quick add
     path('customers/<int:pk>/', views.CustomerDetailView.as_view(), name='customer_detail'),
     path('customers/<int:pk>/edit/', views.CustomerUpdateView.as_view(), name='customer_update'),
     path('customers/<int:pk>/delete/', views.CustomerDeleteView.as_view(), name='customer_delete'),
@@ -33,4 +36,5 @@ urlpatterns = [
     path('orders/<int:pk>/', views.OrderDetailView.as_view(), name='order_detail'), # Bill view
     path('orders/<int:pk>/edit/', views.order_update, name='order_update'), # Use FBV for update
     path('orders/<int:pk>/delete/', views.OrderDeleteView.as_view(), name='order_delete'),
+    path('orders/delivery-plan/', views.delivery_plan, name='delivery_plan'),
 ]
\ No newline at end of file
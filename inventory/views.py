@@ -1,13 +1,24 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.http import Http404, HttpResponseRedirect, JsonResponse
 from django.urls import reverse_lazy, reverse
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, TemplateView
 from django.contrib.auth.mixins import LoginRequiredMixin # For CBVs
 from django.contrib.auth.decorators import login_required # For FBVs
 from django.contrib import messages
+from django.conf import settings
+from django.utils import timezone
 from django.db import transaction # For atomic operations (like saving order + items)
-
-from .models import Product, Category, Customer, Order, OrderItem
-from .forms import ProductForm, CategoryForm, CustomerForm, QuickCustomerForm, OrderForm, OrderItemFormSet
+from django.db.models import Prefetch
+
+from .models import Product, Category, Customer, Order, OrderItem, ArchivedOrder, ArchivedOrderItem, LocationStock, AuditLogEntry
+from .forms import ProductForm, CategoryForm, CustomerForm, QuickCustomerForm, OrderForm, OrderItemFormSet, RepriceForm, DeliveryPlanForm
+from .counters import EMPTY_CONTRIBUTION, form_update_fields, order_contribution, apply_contribution_change
+from .pricing import record_price_change, reprice_products
+from .routing import plan_routes
+from .dedup import matching_customers
+from .stock import InsufficientStock, default_location, take_from, take_stock, return_stock, record_stock_edit
+from .outbox import publish
+from .events import order_event_payload
 
 # --- Home View ---
 class HomeView(LoginRequiredMixin, TemplateView):
@@ -80,9 +91,14 @@ class ProductListView(LoginRequiredMixin, ListView):
     template_name = 'inventory/product_list.html'
     context_object_name = 'products'
     paginate_by = 15 # Optional pagination
+    # ?sort=best_sellers uses the maintained counters, no aggregation needed
+    sort_orders = {'name': 'name', 'best_sellers': '-units_sold', 'revenue': '-revenue'}
 
     def get_queryset(self):
-        queryset = super().get_queryset().select_related('category').order_by('name')
+        ordering = self.sort_orders.get(self.request.GET.get('sort'), 'name')
+        queryset = (super().get_queryset().select_related('category').order_by(ordering, 'pk')
+                    # Per-location stock for the whole page in one extra query
+                    .prefetch_related(Prefetch('location_stock', queryset=LocationStock.objects.select_related('location'))))
         # Optional filtering:
         # category_filter = self.request.GET.get('category')
         # if category_filter:
@@ -94,25 +110,46 @@ class ProductDetailView(LoginRequiredMixin, DetailView):
     template_name = 'inventory/product_detail.html'
     context_object_name = 'product'
 
+    def get_queryset(self):
+        return super().get_queryset().select_related('category').prefetch_related('location_stock__location')
+
 class ProductCreateView(LoginRequiredMixin, CreateView):
     model = Product
     form_class = ProductForm
     template_name = 'inventory/product_form.html'
     success_url = reverse_lazy('product_list')
 
+    @transaction.atomic
     def form_valid(self, form):
+        response = super().form_valid(form)
+        record_stock_edit(self.object, 0) # Opening stock goes to the default location
         messages.success(self.request, "Product created successfully.")
-        return super().form_valid(form)
+        return response
 
-class ProductUpdateView(LoginRequiredMixin, UpdateView):
+class ChangedFieldsUpdateMixin:
+    """Saves only the fields the form changed, so the maintained counters are never overwritten."""
+
+    def form_valid(self, form):
+        self.object = form.save(commit=False)
+        self.object.save(update_fields=form_update_fields(form))
+        form.save_m2m()
+        return HttpResponseRedirect(self.get_success_url())
+
+class ProductUpdateView(LoginRequiredMixin, ChangedFieldsUpdateMixin, UpdateView):
     model = Product
     form_class = ProductForm
     template_name = 'inventory/product_form.html'
     success_url = reverse_lazy('product_list')
 
+    @transaction.atomic
     def form_valid(self, form):
+        if 'price' in form.changed_data:
+            record_price_change(form.instance, form.initial.get('price'), user=self.request.user)
+        response = super().form_valid(form)
+        if 'stock_quantity' in form.changed_data:
+            record_stock_edit(self.object, form.initial.get('stock_quantity'))
         messages.success(self.request, "Product updated successfully.")
-        return super().form_valid(form)
+        return response
 
 class ProductDeleteView(LoginRequiredMixin, DeleteView):
     model = Product
@@ -121,8 +158,9 @@ class ProductDeleteView(LoginRequiredMixin, DeleteView):
 
     def post(self, request, *args, **kwargs):
         product = self.get_object()
-        # Basic check if product is in any NON-CANCELLED order items
-        if OrderItem.objects.filter(product=product).exclude(order__status='CANCELLED').exists():
+        # Basic check if product is in any NON-CANCELLED order items, or in archived orders (PROTECT)
+        if (OrderItem.objects.filter(product=product).exclude(order__status='CANCELLED').exists()
+                or ArchivedOrderItem.objects.filter(product=product).exists()):
              messages.error(request, f"Cannot delete product '{product.name}' as it exists in past orders. Consider deactivating it instead.")
              return redirect('product_list') # Or product detail
 
@@ -130,12 +168,47 @@ class ProductDeleteView(LoginRequiredMixin, DeleteView):
         return super().post(request, *args, **kwargs)
 
 
+# Bulk price change for a category or a set of products
+@login_required
+def product_reprice(request):
+    if request.method == 'POST':
+        form = RepriceForm(request.POST)
+        if form.is_valid():
+            value = form.cleaned_data['value']
+            if form.cleaned_data['change_type'] == 'percent':
+                changed = reprice_products(form.get_queryset(), percent=value, user=request.user)
+            else:
+                changed = reprice_products(form.get_queryset(), amount=value, user=request.user)
+            messages.success(request, f"Repriced {changed} products.")
+            return redirect('product_list')
+    else:
+        form = RepriceForm()
+
+    return render(request, 'inventory/product_reprice.html', {'form': form})
+
+
+# Products whose name contains the typed text, for picking products to reprice
+@login_required
+def product_lookup(request):
+    term = request.GET.get('q', '').strip()
+    if len(term) < 2:
+        return JsonResponse({'results': []})
+    matches = Product.objects.filter(name__icontains=term).order_by('name')[:20]
+    return JsonResponse({'results': [{'id': p.pk, 'name': p.name, 'price': str(p.price)} for p in matches]})
+
+
 # --- Customer Views (Using CBVs) ---
 class CustomerListView(LoginRequiredMixin, ListView):
     model = Customer
     template_name = 'inventory/customer_list.html'
     context_object_name = 'customers'
     paginate_by = 20
+    # ?sort=balance lists the biggest debtors first using the maintained counters
+    sort_orders = {'name': 'name', 'balance': '-balance_due', 'lifetime_spend': '-lifetime_spend'}
+
+    def get_queryset(self):
+        ordering = self.sort_orders.get(self.request.GET.get('sort'), 'name')
+        return super().get_queryset().order_by(ordering, 'pk')
 
 class CustomerDetailView(LoginRequiredMixin, DetailView):
     model = Customer
@@ -145,6 +218,9 @@ class CustomerDetailView(LoginRequiredMixin, DetailView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['orders'] = Order.objects.filter(customer=self.object).order_by('-order_date')
+        # Closed orders moved out by the archive_orders command
+        context['archived_orders'] = ArchivedOrder.objects.filter(customer=self.object).order_by('-order_date')
+        context['archive_summaries'] = self.object.archive_summaries.order_by('-month', 'status')
         return context
 
 class CustomerCreateView(LoginRequiredMixin, CreateView):
@@ -179,8 +255,18 @@ def quick_customer_create(request):
 
     return render(request, 'inventory/quick_customer_form.html', {'form': form})
 
+# Existing customers matching a partly typed phone/email, for suggestions while quick-adding
+@login_required
+def customer_lookup(request):
+    matches = matching_customers(request.GET.get('phone', ''), request.GET.get('email', ''))
+    return JsonResponse({'results': [
+        {'id': c.pk, 'name': c.name, 'phone_number': c.phone_number or '', 'email': c.email or '',
+         'address': c.address, 'url': c.get_absolute_url()}
+        for c in matches
+    ]})
 
-class CustomerUpdateView(LoginRequiredMixin, UpdateView):
+
+class CustomerUpdateView(LoginRequiredMixin, ChangedFieldsUpdateMixin, UpdateView):
     model = Customer
     form_class = CustomerForm
     template_name = 'inventory/customer_form.html'
@@ -205,8 +291,8 @@ class CustomerDeleteView(LoginRequiredMixin, DeleteView):
 
     def post(self, request, *args, **kwargs):
          customer = self.get_object()
-         # Prevent deleting customer if they have orders (use PROTECT in model)
-         if customer.orders.exists():
+         # Prevent deleting customer if they have orders, archived or not (use PROTECT in model)
+         if customer.orders.exists() or customer.archived_orders.exists() or customer.archive_summaries.exists():
              messages.error(request, f"Cannot delete customer '{customer.name}' because they have existing orders.")
              return redirect('customer_detail', pk=customer.pk)
 
@@ -235,6 +321,27 @@ class OrderDetailView(LoginRequiredMixin, DetailView):
         # Prefetch items and their products for efficiency
         return super().get_queryset().prefetch_related('items__product')
 
+    def get_object(self, queryset=None):
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            # Archived orders keep their original pk, so the same URL still works
+            return get_object_or_404(ArchivedOrder.objects.prefetch_related('items__product'), pk=self.kwargs['pk'])
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # Who changed what on this order and its items, newest first
+        context['audit_entries'] = (AuditLogEntry.objects.filter(order_key=self.object.pk)
+                                    .select_related('user').order_by('-timestamp', '-pk')[:50])
+        return context
+
+def _stock_error(request, item_formset, error):
+    """Shows an InsufficientStock error on the item form of the line it concerns."""
+    for form in item_formset.forms:
+        if form.instance is error.item:
+            form.add_error('quantity', str(error))
+    messages.error(request, f"Insufficient stock for {error.item.product.name}.")
+
 # Order Creation (using FBV for handling formset)
 @login_required
 @transaction.atomic # Ensure order and items are saved together or not at all
@@ -248,24 +355,27 @@ def order_create(request):
             # Create the order object but don't save to DB yet
             order = order_form.save(commit=False)
             order.created_by = request.user # Assign the logged-in user
+            order_savepoint = transaction.savepoint() # To drop the order again if stock runs short
             # Initial save to get an ID for linking items
             order.save()
 
             # Now save the items linked to this order
             items = item_formset.save(commit=False)
+            # *** Important: Update stock. Picks the best location(s) and records them on the items ***
+            try:
+                take_stock(items)
+            except InsufficientStock as error:
+                transaction.savepoint_rollback(order_savepoint)
+                order.pk = None # Re-rendered as a new order
+                _stock_error(request, item_formset, error)
+                context = {'order_form': order_form, 'item_formset': item_formset, 'form_title': 'Create New Order'}
+                return render(request, 'inventory/order_form.html', context)
             for item in items:
                 item.order = order
                 # Ensure price_at_order is set (redundant if model save does it, but safe)
                 if not item.price_at_order:
                      item.price_at_order = item.product.price
                 item.save()
-                # *** Important: Update product stock quantity ***
-                product = item.product
-                product.stock_quantity -= item.quantity
-                # Add validation here: check if stock is sufficient before saving!
-                # if product.stock_quantity < 0:
-                #     raise forms.ValidationError(f"Not enough stock for {product.name}") # This should ideally be in formset clean
-                product.save(update_fields=['stock_quantity'])
 
 
             # Save the formset (handles deletions if any)
@@ -276,6 +386,11 @@ def order_create(request):
             order.update_status()   # Update status based on amount_paid
             order.save()            # Final save with correct total and status
 
+            # Update product sales and customer balance counters in this transaction
+            apply_contribution_change(EMPTY_CONTRIBUTION, order_contribution(order))
+            # Side effects (receipt, stock alerts, ...) run later from the outbox
+            publish('order.created', order, order_event_payload(order))
+
             messages.success(request, f"Order #{order.pk} created successfully.")
             return redirect('order_detail', pk=order.pk)
         else:
@@ -296,8 +411,10 @@ def order_create(request):
 @transaction.atomic
 def order_update(request, pk):
     order = get_object_or_404(Order, pk=pk)
-    # Store initial quantities before form processing to calculate stock changes
-    initial_quantities = {item.product.id: item.quantity for item in order.items.all()}
+    # Store initial items before form processing to calculate stock changes
+    initial_items = {item.pk: item for item in order.items.all()}
+    # What the order currently adds to the sales/balance counters
+    initial_contribution = order_contribution(order)
 
     if request.method == 'POST':
         order_form = OrderForm(request.POST, instance=order)
@@ -309,21 +426,27 @@ def order_update(request, pk):
 
             # Process formset items (new, changed, deleted)
             # Handle stock adjustments BEFORE saving formset
+            stock_savepoint = transaction.savepoint() # To undo partial stock moves if a line fails
             # Deleted items: stock should be added back
             for form in item_formset.deleted_forms:
                  if form.instance.pk: # If it's an existing item being deleted
-                     product = form.instance.product
-                     product.stock_quantity += form.instance.quantity
-                     product.save(update_fields=['stock_quantity'])
+                     return_stock(initial_items[form.instance.pk]) # Back to the location it came from
 
             # New/Changed items: adjust stock based on difference
             items_to_save = []
+            new_items = [] # Allocated to locations together below
             for form in item_formset.forms:
                  if form.is_valid() and form.has_changed() and not form.cleaned_data.get('DELETE', False):
                      item = form.save(commit=False)
                      product = item.product
                      new_quantity = item.quantity
-                     original_quantity = initial_quantities.get(product.id, 0)
+                     original = initial_items.get(item.pk)
+                     if original and original.product_id != item.product_id:
+                         # Product swapped on an existing line: return the old stock, allocate the new one
+                         return_stock(original)
+                         item.location = None
+                         original = None
+                     original_quantity = original.quantity if original else 0
                      stock_change = new_quantity - original_quantity
 
                      # Check stock availability ONLY IF quantity increased or it's a new item
@@ -332,13 +455,22 @@ def order_update(request, pk):
                                # Not enough stock, add form error and stop
                                form.add_error('quantity', f"Not enough stock for {product.name}. Available: {product.stock_quantity}")
                                messages.error(request, f"Insufficient stock for {product.name}.")
+                               transaction.savepoint_rollback(stock_savepoint) # Undo stock already moved for other lines
                                # Re-render the form with errors
                                context = {'order_form': order_form, 'item_formset': item_formset, 'order': order, 'form_title': 'Edit Order'}
                                return render(request, 'inventory/order_form.html', context)
 
-                     # Adjust stock (can be negative if quantity decreased)
-                     product.stock_quantity -= stock_change
-                     product.save(update_fields=['stock_quantity'])
+                     # Adjust stock at the line's own location, if it still holds enough for an increase
+                     if original and stock_change > 0:
+                         if not take_from(item.product_id, item.location_id or default_location().pk, stock_change):
+                             # Allocate the whole line again, possibly from another location
+                             return_stock(original)
+                             item.location = None
+                             new_items.append(item)
+                     elif original:
+                         return_stock(item, -stock_change)
+                     else:
+                         new_items.append(item)
 
                      # Ensure price_at_order is set for NEW items
                      if not item.pk:
@@ -346,6 +478,13 @@ def order_update(request, pk):
 
                      items_to_save.append(item)
 
+            try:
+                take_stock(new_items)
+            except InsufficientStock as error:
+                transaction.savepoint_rollback(stock_savepoint)
+                _stock_error(request, item_formset, error)
+                context = {'order_form': order_form, 'item_formset': item_formset, 'order': order, 'form_title': 'Edit Order'}
+                return render(request, 'inventory/order_form.html', context)
 
             # Now save the order and the processed items
             order.save() # Save changes to order fields
@@ -362,6 +501,10 @@ def order_update(request, pk):
             order.update_status()
             order.save()
 
+            # Swap the old contribution for the new one (also covers cancellation)
+            apply_contribution_change(initial_contribution, order_contribution(order))
+            publish('order.updated', order, order_event_payload(order, removed=initial_items.values()))
+
             messages.success(request, f"Order #{order.pk} updated successfully.")
             return redirect('order_detail', pk=order.pk)
         else:
@@ -380,6 +523,39 @@ def order_update(request, pk):
     return render(request, 'inventory/order_form.html', context)
 
 
+# Delivery planning: groups the day's paid/processing orders into one route per driver
+@login_required
+def delivery_plan(request):
+    form = DeliveryPlanForm(request.GET or None, initial={'date': timezone.localdate()})
+    routes = []
+    unplaced = []
+    if form.is_valid():
+        orders = (Order.objects.filter(order_date__date=form.cleaned_data['date'], status__in=['PAID', 'PROCESSING'])
+                  .select_related('customer').order_by('pk'))
+        stops = []
+        for order in orders:
+            if order.customer.latitude is None or order.customer.longitude is None:
+                unplaced.append(order)
+            else:
+                stops.append(order)
+
+        if form.cleaned_data['depot_latitude'] is not None:
+            depot = (float(form.cleaned_data['depot_latitude']), float(form.cleaned_data['depot_longitude']))
+        elif getattr(settings, 'STORE_LOCATION', None):
+            depot = settings.STORE_LOCATION
+        elif stops: # No depot configured: start from the centre of the stops
+            depot = (sum(float(o.customer.latitude) for o in stops) / len(stops),
+                     sum(float(o.customer.longitude) for o in stops) / len(stops))
+
+        if stops:
+            coordinates = [(float(o.customer.latitude), float(o.customer.longitude)) for o in stops]
+            for driver, (indexes, distance) in enumerate(plan_routes(coordinates, depot, form.cleaned_data['drivers']), start=1):
+                routes.append({'driver': driver, 'orders': [stops[i] for i in indexes], 'distance_km': distance})
+
+    context = {'form': form, 'routes': routes, 'unplaced': unplaced}
+    return render(request, 'inventory/delivery_plan.html', context)
+
+
 # Simple Order Delete View (Consider if you really want to delete orders)
 # Maybe an 'archive' or 'cancel' status is better.
 class OrderDeleteView(LoginRequiredMixin, DeleteView):
@@ -392,9 +568,9 @@ class OrderDeleteView(LoginRequiredMixin, DeleteView):
         order = self.get_object()
         # Add stock back for items in the deleted order
         for item in order.items.all():
-            product = item.product
-            product.stock_quantity += item.quantity
-            product.save(update_fields=['stock_quantity'])
+            return_stock(item)
+        apply_contribution_change(order_contribution(order), EMPTY_CONTRIBUTION)
+        publish('order.deleted', order, order_event_payload(order))
 
         messages.success(request, f"Order #{order.pk} deleted and stock restored.")
         # Use super().post() AFTER adjusting stock
@@ -0,0 +1,96 @@
+"""
+Read-replica routing.
+
+When a 'replica' database is configured, reads in safe (GET/HEAD) requests
+go to it and everything else goes to 'default'. Read-after-write stays
+correct because:
+
+* once a request writes (or opens a transaction), the rest of that request
+  reads from the primary, and
+* a request that wrote sets a short-lived cookie that pins the browser to
+  the primary for REPLICA_PIN_SECONDS, covering the redirect after a POST
+  and any replication lag.
+
+Code outside requests (management commands, reports) reads from the primary
+unless it opts in with `with use_replica(): ...`.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+REPLICA = 'replica'
+PRIMARY = 'default'
+PIN_COOKIE = 'primary_pin'
+
+
+class _RoutingState:
+    __slots__ = ('allow_replica', 'wrote')
+
+    def __init__(self, allow_replica=False):
+        self.allow_replica = allow_replica
+        self.wrote = False
+
+
+_state = ContextVar('replica_routing_state', default=None)
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+@contextmanager
+def use_replica():
+    """Lets reads inside the block go to the replica (until something writes)."""
+    token = _state.set(_RoutingState(allow_replica=True))
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if (state is None or not state.allow_replica or state.wrote or not replica_configured()
+                or connections[PRIMARY].in_atomic_block):
+            return PRIMARY
+        return REPLICA
+
+    def db_for_write(self, model, **hints):
+        state = _state.get()
+        if state is not None:
+            state.wrote = True # Read your own writes for the rest of the request
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        if {obj1._state.db, obj2._state.db} <= {PRIMARY, REPLICA}:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema through replication, never through migrate
+        return db == PRIMARY
+
+
+class ReplicaRoutingMiddleware:
+    """Enables replica reads for safe requests that aren't pinned to the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = _RoutingState(
+            allow_replica=request.method in ('GET', 'HEAD') and PIN_COOKIE not in request.COOKIES,
+        )
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if state.wrote and replica_configured():
+            response.set_cookie(PIN_COOKIE, '1', max_age=getattr(settings, 'REPLICA_PIN_SECONDS', 5),
+                                httponly=True, samesite='Lax')
+        return response
@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from django.core.exceptions import ImproperlyConfigured
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -46,10 +49,12 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'stationary_store.replica.ReplicaRoutingMiddleware', # Before sessions, so session reads are routed too
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'inventory.audit.AuditMiddleware', # Needs request.user; writes the request's audit entries in one insert
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -85,6 +90,57 @@ DATABASES = {
     }
 }
 
+# --- Optional read replica ---
+# Safe (GET/HEAD) requests read from 'replica'; writes, and reads after a write,
+# go to 'default'. See stationary_store/replica.py.
+# To try it locally with SQLite, copy db.sqlite3 and point DJANGO_REPLICA_DB at the copy.
+# For PostgreSQL, define DATABASES['replica'] like 'default' with the replica's host.
+if os.environ.get('DJANGO_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DJANGO_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'}, # Tests read and write a single database
+    }
+
+DATABASE_ROUTERS = ['stationary_store.replica.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = 5 # How long a browser keeps reading from the primary after it wrote
+
+# --- Cache, sessions and the logged-in user ---
+# The default cache is per process, so a change made in one web process would not
+# reach the others. Cached sessions and users are therefore only switched on by
+# default with a shared cache: DJANGO_REDIS_URL=redis://localhost:6379/0 (needs `pip install redis`).
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+if os.environ.get('DJANGO_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['DJANGO_REDIS_URL'],
+    }
+
+# DJANGO_SESSION_MODE picks where sessions live:
+#   db        - the django_session table, read on every request (Django's default)
+#   cached_db - cache first, table as the durable copy; reads usually skip the database
+#   cache     - cache only; fastest, but sessions are lost when the cache is flushed
+SESSION_ENGINES = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'cache': 'django.contrib.sessions.backends.cache',
+}
+SHARED_CACHE = bool(os.environ.get('DJANGO_REDIS_URL'))
+SESSION_MODE = os.environ.get('DJANGO_SESSION_MODE', 'cached_db' if SHARED_CACHE else 'db')
+if SESSION_MODE not in SESSION_ENGINES:
+    raise ImproperlyConfigured(f"DJANGO_SESSION_MODE must be one of {', '.join(SESSION_ENGINES)}, not '{SESSION_MODE}'.")
+SESSION_ENGINE = SESSION_ENGINES[SESSION_MODE]
+
+# With a shared cache, logged-in users come from the cache instead of a query per request (see inventory/auth.py)
+AUTHENTICATION_BACKENDS = [
+    'inventory.auth.CachedModelBackend' if SHARED_CACHE else 'django.contrib.auth.backends.ModelBackend',
+]
+AUTH_USER_CACHE_SECONDS = 300
+
 # --- Example PostgreSQL Settings (for Aiven/Supabase/etc.) ---
 # Replace with your actual credentials if/when you switch
 # Make sure to install psycopg2: pip install psycopg2-binary
@@ -156,4 +212,16 @@ CRISPY_TEMPLATE_PACK = "bootstrap5"
 
 LOGIN_REDIRECT_URL = '/' # Redirect to home page after login
 LOGOUT_REDIRECT_URL = '/accounts/login/' # Redirect to login page after logout
-LOGIN_URL = '/accounts/login/' # URL for the login page itself
\ No newline at end of file
+LOGIN_URL = '/accounts/login/' # URL for the login page itself
+
+# (latitude, longitude) of the shop, used as the depot by the delivery planner.
+# If unset, routes start from the centre of the day's stops.
+STORE_LOCATION = None
+
+# Where backup_database writes backups (keep it on a different disk, or sync it off the machine)
+BACKUP_DIR = BASE_DIR / 'backups'
+
+# Modules whose @inventory.outbox.handler functions run for order events (process_outbox command)
+OUTBOX_HANDLER_MODULES = ['inventory.events']
+LOW_STOCK_THRESHOLD = 5 # Logged as a warning by inventory.events.low_stock_alert
+SEND_ORDER_RECEIPTS = False # Needs EMAIL_* settings for a real mail server
@@ -0,0 +1,60 @@
+"""
+Production profile for stationary_store.
+
+Use with: DJANGO_SETTINGS_MODULE=stationary_store.settings_production and
+DJANGO_SECRET_KEY set to a long random value (required here).
+Run `python manage.py collectstatic` after every deploy; it writes hashed,
+pre-gzipped files to STATIC_ROOT for the web server to serve.
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import MIDDLEWARE, TEMPLATES, BASE_DIR
+
+DEBUG = False
+
+# Never fall back to the development key committed in settings.py
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured("Set DJANGO_SECRET_KEY to use the production settings.")
+ALLOWED_HOSTS = os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost,127.0.0.1').split(',')
+
+# Compress HTML responses. Must sit above any middleware that reads or changes the response body.
+MIDDLEWARE = MIDDLEWARE[:1] + ['django.middleware.gzip.GZipMiddleware'] + MIDDLEWARE[1:]
+
+# Parse each template once per process instead of on every request.
+# APP_DIRS has to be off when loaders are listed explicitly.
+TEMPLATES = [{
+    **TEMPLATES[0],
+    'APP_DIRS': False,
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],
+        'loaders': [
+            ('django.template.loaders.cached.Loader', [
+                'django.template.loaders.filesystem.Loader',
+                'django.template.loaders.app_directories.Loader',
+            ]),
+        ],
+    },
+}]
+
+# Static files get content hashes in their names (so they can be cached
+# forever) and a .gz sibling. Example nginx config:
+#
+#   location /static/ {
+#       alias /path/to/staticfiles/;
+#       gzip_static on;
+#       expires max;
+#       add_header Cache-Control "public, immutable";
+#   }
+STATIC_ROOT = BASE_DIR / 'staticfiles'
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'stationary_store.storage.CompressedManifestStaticFilesStorage',
+    },
+}
@@ -0,0 +1,31 @@
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    ManifestStaticFilesStorage that also writes a gzipped copy of each hashed
+    text asset during collectstatic, so the web server can send it as-is
+    (nginx: gzip_static on) instead of compressing on every request.
+    """
+    compress_extensions = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.map', '.xml')
+    min_compress_size = 256 # Smaller files don't gain anything
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super().post_process(paths, dry_run=dry_run, **options):
+            if not dry_run and hashed_name and not isinstance(processed, Exception):
+                if hashed_name.endswith(self.compress_extensions):
+                    self._write_compressed(hashed_name)
+            yield name, hashed_name, processed
+
+    def _write_compressed(self, name):
+        path = self.path(name)
+        with open(path, 'rb') as source:
+            data = source.read()
+        if len(data) < self.min_compress_size:
+            return
+        compressed = gzip.compress(data, compresslevel=9, mtime=0) # mtime=0 keeps the output reproducible
+        if len(compressed) < len(data):
+            with open(path + '.gz', 'wb') as target:
+                target.write(compressed)